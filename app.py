@@ -1,20 +1,159 @@
-from flask import Flask, request, jsonify, render_template, make_response
-from main import Category, Weight, MenuItem, Menu, User
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine, exc
+from flask import Flask, g, request, jsonify, render_template, make_response
+from flask.cli import AppGroup
+from models import Category, Weight, MenuItem, Menu, User, engine, sess, reference, CATEGORIES_WITHOUT_NUTRITION, \
+    NUTRITION, ROLE_SUPER, ROLE_ADMIN
+from cache import CatalogVersion, LRUCache
+from encoding import compress, dumps, ENCODINGS
+from limits import BoundedPool, Busy, RateLimiter
+from metrics import Metrics, QueryTracker
+from search import menu_search, match_query, SEARCH_MATCH
+from sqlalchemy import case, event, exc, func, tuple_
+from sqlalchemy.orm import aliased
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from functools import wraps
+from urllib.parse import urlencode
+import base64
+import click
+import csv
 import datetime
+import hashlib
+import io
+import json
 import jwt
+import os
+import time
 
 
-engine = create_engine("sqlite:///menu.db")
-session = sessionmaker(bind=engine)
-sess = session()
-
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "8BYkEfBA6O6donzWlSihBXox7C0sKR6b"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["JSON_SORT_KEYS"] = False
+app.config["MENU_CACHE_SIZE"] = 64
+app.config["MENU_CACHE_TTL"] = 300
+app.config["MENU_MAX_LIMIT"] = 1000
+app.config["MENU_PAGE_SIZE"] = 100
+app.config["MENU_BULK_LIMIT"] = 5000
+app.config["SEARCH_CACHE_SIZE"] = 256
+app.config["MENU_EXPORT_BATCH_SIZE"] = 1000
+# The smaller responses of the menu are not compressed, the gain does not pay for the work of the client.
+app.config["COMPRESS_MIN_SIZE"] = 1024
+app.config["PRINCIPAL_CACHE_SIZE"] = 1024
+app.config["PRINCIPAL_CACHE_TTL"] = 300
+app.config["PASSWORD_HASH_WORKERS"] = os.cpu_count() or 2
+app.config["PASSWORD_HASH_QUEUE"] = 2 * app.config["PASSWORD_HASH_WORKERS"]
+app.config["PASSWORD_HASH_TIMEOUT"] = 10
+app.config["LOGIN_RATE_LIMIT"] = 10
+app.config["LOGIN_RATE_PERIOD"] = 60
+# The time of the request and of its SQL in the header Server-Timing of the responses.
+app.config["METRICS_SERVER_TIMING"] = False
+# The requests longer than this (in seconds) are logged with their SQL statements, None turns the log off.
+app.config["METRICS_SLOW_REQUEST_SECONDS"] = None
+
+# The rendered responses of the menu are cached by the catalog version,
+# POST/PUT/DELETE of the menu items bump the version and drop the cached responses.
+catalog_version = CatalogVersion()
+menu_cache = LRUCache(max_size=app.config["MENU_CACHE_SIZE"], ttl=app.config["MENU_CACHE_TTL"])
+# The results of the search are cached separately, so the many different searches do not evict the menu.
+search_cache = LRUCache(max_size=app.config["SEARCH_CACHE_SIZE"], ttl=app.config["MENU_CACHE_TTL"])
+# The ETag and Last-Modified of the last rendered body of each view. The catalog version only moves with
+# the changes made by this process, so Last-Modified is the time of the render of a new body instead.
+rendered_views = LRUCache(max_size=app.config["MENU_CACHE_SIZE"] + app.config["SEARCH_CACHE_SIZE"], ttl=24 * 3600)
+
+# The user of the access token, as it is passed to the handlers.
+Principal = namedtuple("Principal", ["id", "name", "role"])
+# The principals of the verified tokens, so repeated calls skip the decoding of the token and the query of the user.
+principal_cache = LRUCache(max_size=app.config["PRINCIPAL_CACHE_SIZE"], ttl=app.config["PRINCIPAL_CACHE_TTL"])
+
+# The passwords are hashed (deliberately slow) in a separate bounded pool, so a burst of logins does not take
+# all the threads of the server from the menu reads: when the pool is full, 503 is returned at once.
+password_pool = BoundedPool(workers=app.config["PASSWORD_HASH_WORKERS"],
+                            queue_size=app.config["PASSWORD_HASH_QUEUE"],
+                            timeout=app.config["PASSWORD_HASH_TIMEOUT"])
+login_limiter = RateLimiter(rate=app.config["LOGIN_RATE_LIMIT"], period=app.config["LOGIN_RATE_PERIOD"])
+
+# The latency and the SQL of the requests by endpoint, see /metrics.
+metrics = Metrics()
+query_tracker = QueryTracker()
+
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    """Rolls back the transaction left open by a failed request and returns the connection to the pool."""
+    if exception is not None:
+        sess.rollback()
+    sess.remove()
+
+
+# The start of the statement is kept on its execution context, which is dropped with the statement,
+# so the statements that fail (and have no after_cursor_execute) leave nothing on the pooled connection.
+@event.listens_for(engine, "before_cursor_execute")
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._menu_query_start = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_menu_query_start", None)
+    if start is not None:
+        query_tracker.record(statement, time.perf_counter() - start)
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.request_started()
+    query_tracker.start(keep_statements=app.config["METRICS_SLOW_REQUEST_SECONDS"] is not None)
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Records the latency and the SQL of the request, adds Server-Timing and logs the slow request."""
+    if "request_start" not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    query_tracker.stop()
+    # The rule of the route, not the path, so the number of the series stays bounded.
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe(endpoint, request.method, response.status_code, seconds, query_tracker.count,
+                    query_tracker.seconds)
+    if app.config["METRICS_SERVER_TIMING"]:
+        response.headers["Server-Timing"] = f'db;dur={query_tracker.seconds * 1000:.2f};' \
+                                            f'desc="{query_tracker.count} queries", app;dur={seconds * 1000:.2f}'
+    slow = app.config["METRICS_SLOW_REQUEST_SECONDS"]
+    if slow is not None and seconds >= slow:
+        statements = "\n".join(f"  {duration * 1000:.2f} ms: {statement}"
+                               for statement, duration in query_tracker.statements or [])
+        app.logger.warning("Slow request %s %s: %.3f s, %d SQL statements in %.3f s\n%s",
+                           request.method, request.full_path.rstrip("?"), seconds, query_tracker.count,
+                           query_tracker.seconds, statements)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exception=None):
+    if "request_start" in g:
+        metrics.request_finished()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def user_changed(mapper, connection, user):
+    """Drops the cached principals of the changed user."""
+    principal_cache.discard_if(lambda token, principal: principal.id == user.id)
+
+
+def rate_limited(f):
+    """Limits the requests of each client (by address) to LOGIN_RATE_LIMIT per LOGIN_RATE_PERIOD seconds."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        retry_after = login_limiter.allow(request.remote_addr)
+        if retry_after:
+            return jsonify({"message": "Too many requests."}), 429, {"Retry-After": str(int(retry_after) + 1)}
+        return f(*args, **kwargs)
+
+    return decorated
 
 
 def token_required(f):
@@ -26,40 +165,192 @@ def token_required(f):
         if not token:
             return jsonify({"message": "Token is missing!"}), 401
 
-        try:
-            data = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
-            curr_user = sess.query(User).filter(User.email == data["email"]).first()
-        except:
-            return jsonify({"message": "Token is invalid!"}), 401
+        curr_user = principal_cache.get(token)
+        if curr_user is None:
+            try:
+                data = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+                # The tokens minted before the claim id was added are found by email.
+                if "id" in data:
+                    user = sess.get(User, data["id"])
+                else:
+                    user = sess.query(User).filter(User.email == data["email"]).first()
+                curr_user = Principal(user.id, user.name, user.role)
+            except:
+                return jsonify({"message": "Token is invalid!"}), 401
+            # The principal is not kept longer than the token is valid.
+            ttl = min(app.config["PRINCIPAL_CACHE_TTL"], data.get("exp", float("inf")) - time.time())
+            principal_cache.set(token, curr_user, ttl=ttl)
 
         return f(curr_user, *args, **kwargs)
 
     return decorated
 
 
+def menu_query():
+    """Returns the query of menu rows joined with their title.
+    All the data for the response is selected in one query, without lookups for each row:
+    the names of the category and weight are taken from the reference data."""
+    return sess.query(Menu.id_menu_item,
+                      Menu.category_id,
+                      Menu.weight_id,
+                      MenuItem.title,
+                      Menu.weight_desc,
+                      Menu.price,
+                      MenuItem.anonce,
+                      Menu.calories,
+                      Menu.carbohydrates,
+                      Menu.fats,
+                      Menu.proteins).join(MenuItem, Menu.title_id == MenuItem.id_item)
+
+
+# The fields of the items of the menu, the responses can be limited to some of them by fields=title,price,...
+MENU_ITEM_FIELDS = ["title", "category", "size", "weight", "price", "anonce"] + NUTRITION
+
+
+def menu_row_item(row, category_names, weight_names):
+    """Returns the item of the menu for the row of the menu_query, the maps of names are passed by the caller."""
+    menu_item = {}
+    menu_item["title"] = row.title
+    menu_item["category"] = category_names[row.category_id]
+    menu_item["size"] = weight_names[row.weight_id]
+    menu_item["weight"] = row.weight_desc
+    menu_item["price"] = row.price
+    menu_item["anonce"] = row.anonce
+    if menu_item["category"] not in CATEGORIES_WITHOUT_NUTRITION:
+        menu_item["calories"] = row.calories
+        menu_item["carbohydrates"] = row.carbohydrates
+        menu_item["fats"] = row.fats
+        menu_item["proteins"] = row.proteins
+    return menu_item
+
+
 def get_menu_items(menu_items):
     """Returns the list of items in the menu.
-        It takes table elements as a parameter."""
-    menu = []
-    try:
-        for row in menu_items:
-            menu_item = {}
-            menu_item["title"] = row.MenuItem.title
-            menu_item["category"] = sess.query(Category).filter_by(id_category=row.Menu.category_id).first().name
-            menu_item["size"] = sess.query(Weight).filter_by(id_weight=row.Menu.weight_id).first().weight
-            menu_item["weight"] = row.Menu.weight_desc
-            menu_item["price"] = row.Menu.price
-            menu_item["anonce"] = row.MenuItem.anonce
-            # In the menu of categories drinks and sauces no values (calories, carbs, fats, proteins).
-            if row.Menu.category_id != 4 and row.Menu.category_id != 5:
-                menu_item["calories"] = row.Menu.calories
-                menu_item["carbohydrates"] = row.Menu.carbohydrates
-                menu_item["fats"] = row.Menu.fats
-                menu_item["proteins"] = row.Menu.proteins
-            menu.append(menu_item)
-    except:
-        menu = []
-    return menu
+        It takes the rows of the menu_query as a parameter.
+        The errors are raised, so a menu that failed to load is not cached as an empty one."""
+    rows = list(menu_items)
+    category_names = reference.category_names
+    weight_names = reference.weight_names
+    if not all(row.category_id in category_names and row.weight_id in weight_names for row in rows):
+        # A category or weight added by another process, the maps are loaded again.
+        reference.invalidate()
+        category_names = reference.category_names
+        weight_names = reference.weight_names
+    return [menu_row_item(row, category_names, weight_names) for row in rows]
+
+
+def menu_changed():
+    """Bumps the catalog version after the menu was changed."""
+    catalog_version.bump()
+    menu_cache.clear()
+    search_cache.clear()
+
+
+def select_fields(menu_items, fields):
+    """Returns the items with only the given fields (the fields missing in an item are left out)."""
+    return [{name: menu_item[name] for name in fields if name in menu_item} for menu_item in menu_items]
+
+
+def parse_fields(value):
+    """Returns the list of fields of the parameter fields (None without it) and the error message, or None."""
+    if value is None:
+        return None, None
+    fields = [name for name in value.split(",") if name]
+    if not fields or not set(fields).issubset(MENU_ITEM_FIELDS):
+        return None, f"Fields must be some of: {', '.join(MENU_ITEM_FIELDS)}."
+    return fields, None
+
+
+def parse_limit(value, default=None):
+    """Returns the limit of the parameter (the default without it) and the error message, or None."""
+    if value is None:
+        return default, None
+    if not (value.isascii() and value.isdigit()) or not 0 < int(value) <= app.config["MENU_MAX_LIMIT"]:
+        return None, f"Limit must be an integer from 1 to {app.config['MENU_MAX_LIMIT']}."
+    return int(value), None
+
+
+def entry_modified(view, etag):
+    """Returns the Last-Modified of the view rendered with the ETag: the time of the render when the body changed,
+    the previous value when the body is the same (the entry expired), so it moves forward only with the body."""
+    rendered = rendered_views.get(view)
+    if rendered is not None and rendered[0] == etag:
+        return rendered[1]
+    modified = time.time()
+    rendered_views.set(view, (etag, modified))
+    return modified
+
+
+def menu_entry(view, menu_items, fields):
+    """Returns the cache entry of the rendered view: the body, its ETag, its Last-Modified
+    and the dict of the compressed bodies (filled by entry_body)."""
+    if not isinstance(menu_items, dict):
+        menu_items = {"menu": menu_items}
+    if fields:
+        menu_items = dict(menu_items, menu=select_fields(menu_items["menu"], fields))
+    body = dumps(menu_items)
+    etag = hashlib.sha1(body).hexdigest()
+    return body, etag, entry_modified(view, etag), {}
+
+
+def entry_encoding(entry, accept_encodings):
+    """Returns the content coding of the entry for the Accept-Encoding of the client, None for the identity."""
+    if len(entry[0]) < app.config["COMPRESS_MIN_SIZE"]:
+        return None
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def entry_body(entry, encoding):
+    """Returns the body of the entry in the content coding and its ETag, each coding is compressed once."""
+    body, etag, modified, compressed = entry
+    if not encoding:
+        return body, etag
+    if encoding not in compressed:
+        compressed[encoding] = compress(body, encoding)
+    # Each coding of the body is a different representation, with its own ETag.
+    return compressed[encoding], f"{etag}-{encoding}"
+
+
+def menu_response(view, load_items, cache=menu_cache):
+    """Returns the JSON response of the menu view from the cache.
+    On a miss, load_items is called to get the list of items (or the dict of the whole response),
+    the rendered response is stored in the cache. If load_items returns None, nothing is cached and None is returned.
+    With the parameter fields, the items have only these fields.
+    The body is compressed (gzip or br) if the client accepts it, the compressed bodies are kept with the entry,
+    so each body is compressed once for the catalog version.
+    The response has a strong ETag of its content and Last-Modified of the first render of this content,
+    if the client already has it, 304 Not Modified is returned without the body."""
+    fields, error = parse_fields(request.args.get("fields"))
+    if error:
+        return jsonify({"message": error}), 400
+    if fields:
+        view = f"{view}|fields={','.join(fields)}"
+    # The version is taken before loading, so a response rendered while the menu was changed is not served later.
+    key = (view, catalog_version.value)
+    entry = cache.get(key)
+    if entry is None:
+        menu_items = load_items()
+        if menu_items is None:
+            return None
+        entry = menu_entry(view, menu_items, fields)
+        cache.set(key, entry)
+    encoding = entry_encoding(entry, request.accept_encodings)
+    body, etag = entry_body(entry, encoding)
+    response = app.response_class(body, mimetype=app.config["JSONIFY_MIMETYPE"])
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    response.last_modified = entry[2]
+    # Clients can keep the menu, but have to revalidate it on every request.
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.errorhandler(Busy)
+@app.errorhandler(FutureTimeoutError)
+def busy_error(error):
+    return jsonify({"message": "The server is busy, try again later."}), 503, {"Retry-After": "1"}
 
 
 @app.errorhandler(404)
@@ -73,50 +364,288 @@ def home():
     return render_template("index.html")
 
 
+# The columns filtered by the ranges of the listing: min_<name> and max_<name>.
+RANGE_COLUMNS = {"price": Menu.price, **{name: getattr(Menu, name) for name in NUTRITION}}
+# The parameters of the paginated listing of the menu, without them /menu returns the whole menu.
+LISTING_PARAMS = {"limit", "cursor", "sort", "order", "category", "size"} | {
+    f"{bound}_{name}" for name in RANGE_COLUMNS for bound in ("min", "max")}
+# The columns of the sort orders of the listing, the id of the row is added to make the order unique.
+# Categories are sorted in the order of their ids (as in CATEGORIES_MENU), so the index of category_id is used.
+# The rows without the nutrition value (drinks and sauces) are left out when sorted by it.
+SORT_COLUMNS = {"category": Menu.category_id, "price": Menu.price, "title": MenuItem.title,
+                **{name: getattr(Menu, name) for name in NUTRITION}}
+
+
+def encode_cursor(sort, order, row):
+    """Returns the cursor of the next page, it keeps the sort key of the last row of the page."""
+    data = [sort, order, row._mapping[SORT_COLUMNS[sort]], row.id_menu_item]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort, order):
+    """Returns the sort key of the last row of the previous page, None if the cursor is invalid."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(data, list) or len(data) != 4:
+            return None
+        if data[0] != sort or data[1] != order or not isinstance(data[3], int) or isinstance(data[3], bool):
+            return None
+        # The sort key is bound in the query, only the values of the sort columns are accepted.
+        if not isinstance(data[2], (str, int, float)) or isinstance(data[2], bool):
+            return None
+        return data[2], data[3]
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+def menu_listing():
+    """Returns the page of the menu: the filters and the sort order are applied in SQL,
+    the next page starts after the sort key of the last row (keyset pagination), so each page costs the same."""
+    sort = request.args.get("sort", "category")
+    order = request.args.get("order", "asc")
+    if sort not in SORT_COLUMNS:
+        return jsonify({"message": f"Sort must be one of: {', '.join(SORT_COLUMNS)}."}), 400
+    if order != "asc" and order != "desc":
+        return jsonify({"message": "Order must be asc or desc."}), 400
+    limit, error = parse_limit(request.args.get("limit"), app.config["MENU_PAGE_SIZE"])
+    if error:
+        return jsonify({"message": error}), 400
+    filters = []
+    if "category" in request.args:
+        category_id = reference.categories.get(request.args["category"])
+        if category_id is None:
+            return jsonify({"message": f"Invalid category name: {request.args['category']}."}), 400
+        filters.append(Menu.category_id == category_id)
+    if "size" in request.args:
+        weight_id = reference.weights.get(request.args["size"])
+        if weight_id is None:
+            return jsonify({"message": f"Invalid weight name: {request.args['size']}."}), 400
+        filters.append(Menu.weight_id == weight_id)
+    for name, column in RANGE_COLUMNS.items():
+        for bound in ("min", "max"):
+            param = f"{bound}_{name}"
+            if param in request.args:
+                try:
+                    value = float(request.args[param])
+                except ValueError:
+                    return jsonify({"message": f"{param} must be a number."}), 400
+                filters.append(column >= value if bound == "min" else column <= value)
+    after = None
+    if "cursor" in request.args:
+        after = decode_cursor(request.args["cursor"], sort, order)
+        if after is None:
+            return jsonify({"message": "Invalid cursor."}), 400
+
+    def load_items():
+        menu_items = menu_query()
+        if filters:
+            menu_items = menu_items.filter(*filters)
+        column = SORT_COLUMNS[sort]
+        if sort in NUTRITION:
+            menu_items = menu_items.filter(column.isnot(None))
+        if after is not None:
+            key = tuple_(column, Menu.id_menu_item)
+            menu_items = menu_items.filter(key > tuple_(*after) if order == "asc" else key < tuple_(*after))
+        if order == "asc":
+            menu_items = menu_items.order_by(column, Menu.id_menu_item)
+        else:
+            menu_items = menu_items.order_by(column.desc(), Menu.id_menu_item.desc())
+        # One more row is selected to know if there is a next page.
+        rows = menu_items.limit(limit + 1).all()
+        next_cursor = encode_cursor(sort, order, rows[limit - 1]) if len(rows) > limit else None
+        return {"menu": get_menu_items(rows[:limit]), "next_cursor": next_cursor}
+
+    view = "menu?" + urlencode(sorted((name, value) for name, value in request.args.items() if name in LISTING_PARAMS))
+    return menu_response(view, load_items)
+
+
+def full_menu_query():
+    """Returns the query of the whole menu, sorted by the name of the category."""
+    positions = {id_category: position for position, (name, id_category) in enumerate(
+        sorted(reference.categories.items()))}
+    return menu_query().order_by(case(positions, value=Menu.category_id), Menu.id_menu_item)
+
+
+def category_query(category_id):
+    """Returns the query of the items of the category."""
+    return menu_query().filter(Menu.category_id == category_id)
+
+
+def price_extremes_query(category_id, highest, limit):
+    """Returns the query of the most expensive (or the cheapest) items of the category,
+    all items with the max (min) price without limit, the top limit items with it."""
+    menu_items = category_query(category_id)
+    if limit is None:
+        extreme_menu = aliased(Menu)
+        extreme_price = sess.query(func.max(extreme_menu.price) if highest else func.min(extreme_menu.price)).filter(
+            extreme_menu.category_id == category_id).scalar_subquery()
+        return menu_items.filter(Menu.price == extreme_price).order_by(Menu.id_menu_item)
+    return menu_items.order_by(Menu.price.desc() if highest else Menu.price, Menu.id_menu_item).limit(limit)
+
+
+def search_query(match, category_ids, limit):
+    """Returns the query of the items matching the FTS5 query match, the best matches first."""
+    menu_items = menu_query().join(menu_search, menu_search.c.rowid == Menu.id_menu_item).filter(SEARCH_MATCH(match))
+    if category_ids:
+        menu_items = menu_items.filter(Menu.category_id.in_(category_ids))
+    return menu_items.order_by(menu_search.c.rank, Menu.id_menu_item).limit(limit)
+
+
+def search_params(args):
+    """Returns the FTS5 query, the ids of the categories and the limit of the search parameters
+    and the error message, or None."""
+    match = match_query(args.get("q", ""))
+    if match is None:
+        return None, "Query q must contain at least one word."
+    limit, error = parse_limit(args.get("limit"), app.config["MENU_PAGE_SIZE"])
+    if error:
+        return None, error
+    category_ids = []
+    for category in args.getlist("category"):
+        if category not in reference.categories:
+            return None, f"Invalid category name: {category}."
+        category_ids.append(reference.categories[category])
+    return (match, category_ids, limit), None
+
+
+def search_view(match, category_ids, limit):
+    """Returns the key of the search in the cache."""
+    return f"search?{match}&{sorted(category_ids)}&{limit}"
+
+
+def price_extremes_view(category, highest, limit):
+    """Returns the key of the most expensive (or the cheapest) items in the cache."""
+    return f"menu/{category}/{'expensive' if highest else 'cheap'}/{limit or ''}"
+
+
 @app.route("/menu")
 def get_all_menu():
-    menu_items = sess.query(Menu, MenuItem).filter(Menu.title_id == MenuItem.id_item)
-    return jsonify(menu=sorted(get_menu_items(menu_items), key=lambda i: i["category"]))
+    if LISTING_PARAMS.intersection(request.args):
+        return menu_listing()
+    return menu_response("menu", lambda: get_menu_items(full_menu_query()))
+
+
+# The formats of the export: the media type of the response and the fields (the columns of CSV).
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = ["id"] + MENU_ITEM_FIELDS
+
+
+def export_batches(statement, batch_size):
+    """Yields the items of the rows of the statement in lists of batch_size.
+    The rows are fetched from the cursor batch by batch on a connection of its own (the session of the request
+    is removed before the response is streamed), so the memory does not depend on the size of the menu."""
+    category_names = reference.category_names
+    weight_names = reference.weight_names
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(statement)
+        for rows in result.partitions(batch_size):
+            yield [{"id": row.id_menu_item, **menu_row_item(row, category_names, weight_names)} for row in rows]
+
+
+def export_ndjson(batches):
+    """Yields the items as JSON, one item per line."""
+    for items in batches:
+        yield "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+
+
+def export_csv(batches):
+    """Yields the items as CSV with the header, the missing values are empty."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, restval="")
+    writer.writeheader()
+    for items in batches:
+        writer.writerows(items)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+@app.route("/menu/export")
+def export_menu():
+    """Streams the whole menu in the order of ids as NDJSON (default) or CSV, format=ndjson|csv.
+    Unlike GET /menu, the response is written while the rows are read, nothing is materialized or cached."""
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"message": f"Format must be one of: {', '.join(EXPORT_FORMATS)}."}), 400
+    batches = export_batches(menu_query().order_by(Menu.id_menu_item).statement, app.config["MENU_EXPORT_BATCH_SIZE"])
+    body = export_ndjson(batches) if export_format == "ndjson" else export_csv(batches)
+    response = app.response_class(body, mimetype=EXPORT_FORMATS[export_format])
+    response.headers["Content-Disposition"] = f"attachment; filename=menu.{export_format}"
+    return response
+
+
+@app.route("/menu/search")
+def search_menu():
+    """Returns the rows of the menu with all the words of q in the title, anonce or weight (as prefixes of words),
+    the best matches first. The rows can be filtered by one or more category parameters.
+    The ranking has to score every match, so the responses are cached by the catalog version as the menu views."""
+    params, error = search_params(request.args)
+    if error:
+        return jsonify({"message": error}), 400
+    return menu_response(search_view(*params), lambda: get_menu_items(search_query(*params)), cache=search_cache)
 
 
 @app.route("/menu/<category>", methods=["GET"])
 def get_items_category(category):
-    try:
-        category_id = sess.query(Category).filter(Category.name == category).first().id_category
-    except AttributeError:
+    category_id = reference.categories.get(category)
+    if category_id is None:
         return jsonify({"message": f"Invalid category name: {category}."}), 400
-    menu_items = sess.query(Menu, MenuItem).filter(Menu.category_id == category_id).filter(
-        Menu.title_id == MenuItem.id_item)
-    return jsonify(menu=get_menu_items(menu_items))
+    return menu_response(f"menu/{category}", lambda: get_menu_items(category_query(category_id)))
+
 
+@app.route("/cache/stats")
+def get_cache_stats():
+    return jsonify(version=catalog_version.value, menu=menu_cache.stats(), search=search_cache.stats())
 
-@app.route("/menu/pizza/expensive")
-def get_expensive_pizza():
-    price = sess.query(Menu.price).filter(Menu.category_id == 1).all()
-    menu_items = sess.query(Menu, MenuItem).filter(Menu.category_id == 1).filter(
-        Menu.title_id == MenuItem.id_item).filter(Menu.price == max(price)[0])
-    return jsonify(menu=get_menu_items(menu_items))
 
+@app.route("/metrics")
+def get_metrics():
+    """Returns the metrics of the requests and the caches in the text format of Prometheus."""
+    body = metrics.render({"menu": menu_cache.stats(),
+                           "search": search_cache.stats(),
+                           "principal": principal_cache.stats()})
+    return app.response_class(body, content_type="text/plain; version=0.0.4; charset=utf-8")
 
-@app.route("/menu/pizza/cheap")
-def get_cheap_pizza():
-    price = sess.query(Menu.price).filter(Menu.category_id == 1).all()
-    menu_items = sess.query(Menu, MenuItem).filter(Menu.category_id == 1).filter(
-        Menu.title_id == MenuItem.id_item).filter(Menu.price == min(price)[0])
-    return jsonify(menu=get_menu_items(menu_items))
+
+def price_extremes(category, highest):
+    """Returns the response with the most expensive (or the cheapest) items of the category.
+    Without the parameter limit, all items with the max (min) price are returned, with limit=N the top N items.
+    The result is computed in one query by the index on (category_id, price), the memory does not depend on
+    the size of the catalog."""
+    limit, error = parse_limit(request.args.get("limit"))
+    if error:
+        return jsonify({"message": error}), 400
+
+    category_id = reference.categories.get(category)
+    if category_id is None:
+        return jsonify({"message": f"Invalid category name: {category}."}), 400
+    return menu_response(price_extremes_view(category, highest, limit),
+                         lambda: get_menu_items(price_extremes_query(category_id, highest, limit)))
+
+
+@app.route("/menu/<category>/expensive")
+def get_expensive_items(category):
+    return price_extremes(category, highest=True)
+
+
+@app.route("/menu/<category>/cheap")
+def get_cheap_items(category):
+    return price_extremes(category, highest=False)
 
 
 @app.route("/menu", methods=["POST"])
 @token_required
 def add_new_item(curr_user):
-    if curr_user.name != "super" and curr_user.name != "admin":
+    if curr_user.role != ROLE_SUPER and curr_user.role != ROLE_ADMIN:
         return jsonify({"message": "No access to this function."}), 403
 
     title = MenuItem.validate_title(request.form.get("title"))
     category = Category.validate_category(request.form.get("category"))
     weight = Weight.validate_weight(request.form.get("weight"))
     price = Menu.validate_price(request.form.get("price"))
-    for item in (title, category, weight, price):
+    nutrition = {name: Menu.validate_nutrition(name, request.form.get(name)) for name in NUTRITION}
+    for item in (title, category, weight, price, *nutrition.values()):
         if isinstance(item, dict):
             return jsonify(item), 400
     try:
@@ -127,20 +656,19 @@ def add_new_item(curr_user):
                           photo_second=request.form.get("photo_second")))
 
         sess.add(Menu(title_id=sess.query(MenuItem).filter_by(title=title).first().id_item,
-                      category_id=sess.query(Category).filter_by(name=category).first().id_category,
-                      weight_id=sess.query(Weight).filter_by(weight=weight).first().id_weight,
+                      category_id=reference.categories[category],
+                      weight_id=reference.weights[weight],
                       weight_desc=request.form.get("weight_desc"),
                       price=price,
-                      calories=request.form.get("calories"),
-                      carbohydrates=request.form.get("carbohydrates"),
-                      fats=request.form.get("fats"),
-                      proteins=request.form.get("proteins"),
-                      user_create=curr_user.id))
+                      user_create=curr_user.id,
+                      **nutrition))
         sess.commit()
-        new_item = sess.query(Menu, MenuItem).filter(MenuItem.title == title).filter(Menu.title_id == MenuItem.id_item)
-        return jsonify(menu={"Successfully added the new item in Menu:": get_menu_items(new_item)}), 201
-    finally:
-        sess.close()
+    except exc.IntegrityError:
+        sess.rollback()
+        return jsonify({"message": f"{title} already exits. Title must be unique."}), 400
+    menu_changed()
+    new_item = menu_query().filter(MenuItem.title == title)
+    return jsonify(menu={"Successfully added the new item in Menu:": get_menu_items(new_item)}), 201
 
 
 @app.route("/menu/<item_id>", methods=["PUT"])
@@ -149,8 +677,8 @@ def update_menu_item(curr_user, item_id):
     try:
         update_item = sess.query(Menu, MenuItem).filter(Menu.id_menu_item == item_id).filter(
             MenuItem.id_item == Menu.title_id).one()
-        if curr_user.name != "super" and curr_user.name != "admin" or \
-                curr_user.name == "admin" and curr_user.id != update_item.Menu.user_create:
+        if curr_user.role != ROLE_SUPER and curr_user.role != ROLE_ADMIN or \
+                curr_user.role == ROLE_ADMIN and curr_user.id != update_item.Menu.user_create:
             return jsonify({"message": "No access to this function."}), 403
 
         title = request.form.get("title")
@@ -159,31 +687,29 @@ def update_menu_item(curr_user, item_id):
         category = Category.validate_category(request.form.get("category"))
         weight = Weight.validate_weight(request.form.get("weight"))
         price = Menu.validate_price(request.form.get("price"))
-        for item in (category, weight, price):
+        nutrition = {name: Menu.validate_nutrition(name, request.form.get(name)) for name in NUTRITION}
+        for item in (category, weight, price, *nutrition.values()):
             if isinstance(item, dict):
                 return jsonify(item), 400
         try:
             update_item.MenuItem.title = title
-            update_item.Menu.category_id = sess.query(Category).filter_by(name=category).first().id_category
-            update_item.Menu.weight_id = sess.query(Weight).filter_by(weight=weight).first().id_weight
+            update_item.Menu.category_id = reference.categories[category]
+            update_item.Menu.weight_id = reference.weights[weight]
             update_item.Menu.weight_desc = request.form.get("weight_desc")
             update_item.Menu.price = price
             update_item.MenuItem.anonce = request.form.get("anonce")
-            update_item.Menu.calories = request.form.get("calories")
-            update_item.Menu.carbohydrates = request.form.get("carbohydrates")
-            update_item.Menu.fats = request.form.get("fats")
-            update_item.Menu.proteins = request.form.get("proteins")
+            for name, value in nutrition.items():
+                setattr(update_item.Menu, name, value)
             update_item.MenuItem.photo_small = request.form.get("photo_small")
             update_item.MenuItem.photo_first = request.form.get("photo_first")
             update_item.MenuItem.photo_second = request.form.get("photo_second")
             sess.commit()
-            update_item = sess.query(Menu, MenuItem).filter(Menu.id_menu_item == item_id).filter(
-                            MenuItem.id_item == Menu.title_id)
+            menu_changed()
+            update_item = menu_query().filter(Menu.id_menu_item == item_id)
             return jsonify(menu={"Successfully updated the item in Menu:": get_menu_items(update_item)}), 201
         except exc.IntegrityError:
+            sess.rollback()
             return jsonify({"message": f"{title} already exists in the menu. Title must be unique."}), 400
-        finally:
-            sess.close()
     except exc.NoResultFound:
         return jsonify({"message": f"Unable to find item with id: {item_id}."}), 404
 
@@ -194,39 +720,281 @@ def delete_menu_item(curr_user, item_id):
     try:
         delete_item = sess.query(Menu).filter(Menu.id_menu_item == item_id)
         title_id = delete_item.first().title_id
-        if curr_user.name != "super" and curr_user.name != "admin" or \
-                curr_user.name == "admin" and curr_user.id != delete_item.first().user_create:
+        if curr_user.role != ROLE_SUPER and curr_user.role != ROLE_ADMIN or \
+                curr_user.role == ROLE_ADMIN and curr_user.id != delete_item.first().user_create:
             return jsonify({"message": "No access to this function."}), 403
-        delete_item.delete()
-        # If it was the only product in the Menu table, it can also be removed from the table MenuItem
-        if not sess.query(Menu).filter(Menu.title_id == title_id).first():
-            sess.query(MenuItem).filter(MenuItem.id_item == title_id).delete()
-        sess.commit()
+        try:
+            delete_item.delete()
+            # If it was the only product in the Menu table, it can also be removed from the table MenuItem
+            if not sess.query(Menu).filter(Menu.title_id == title_id).first():
+                sess.query(MenuItem).filter(MenuItem.id_item == title_id).delete()
+            sess.commit()
+        except exc.SQLAlchemyError:
+            sess.rollback()
+            raise
+        menu_changed()
         return jsonify(menu={"Successfully delete the item with id:": item_id}), 200
     except (exc.NoResultFound, AttributeError):
         return jsonify({"message": f"Unable to find item with id: {item_id}."}), 404
 
 
+# The fields of the bulk requests that are copied to the tables as they are (the nutrition values as numbers).
+ITEM_FIELDS = ["anonce", "photo_small", "photo_first", "photo_second"]
+MENU_FIELDS = ["weight_desc"]
+# The number of values in one IN (...) of the bulk requests (SQLite limits the number of parameters).
+BULK_BATCH_SIZE = 500
+
+
+def batches(values, size=BULK_BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def bulk_request(with_id=True):
+    """Returns the list of items of the bulk request and the error response (one of them is None).
+    The items are objects, for PATCH and DELETE each of them must have the integer id of the menu row."""
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return None, (jsonify({"message": "The body must be a non-empty JSON array of objects."}), 400)
+    if len(items) > app.config["MENU_BULK_LIMIT"]:
+        return None, (jsonify({"message": f"At most {app.config['MENU_BULK_LIMIT']} items in one request."}), 400)
+    if with_id and not all(isinstance(item.get("id"), int) and not isinstance(item["id"], bool) for item in items):
+        return None, (jsonify({"message": "Each item must have the integer id of the menu item."}), 400)
+    return items, None
+
+
+def bulk_errors(item, categories, weights, partial=False):
+    """Returns the messages of the invalid fields of the item, the categories and weights are preloaded maps.
+    If partial, only the fields present in the item are checked."""
+    messages = []
+    for name, values in (("category", categories), ("weight", weights)):
+        if partial and name not in item:
+            continue
+        if not item.get(name):
+            messages.append(f"{name.title()} must be a non-empty.")
+        elif not isinstance(item[name], str):
+            messages.append(f"{name.title()} must be a string.")
+        elif item[name] not in values:
+            messages.append(f"Invalid {name} name: {item[name]}.")
+    if not partial or "price" in item:
+        price = Menu.validate_price(item.get("price"))
+        if isinstance(price, dict):
+            messages.append(price["message"])
+    # The text fields are stored as they are, so only strings (or null) are accepted.
+    for name in ITEM_FIELDS + MENU_FIELDS:
+        if item.get(name) is not None and not isinstance(item[name], str):
+            messages.append(f"{name.title()} must be a string.")
+    for name in NUTRITION:
+        value = Menu.validate_nutrition(name, item.get(name))
+        if isinstance(value, dict):
+            messages.append(value["message"])
+    return messages
+
+
+def menu_values(item):
+    """Returns the values of the Menu table present in the item of the bulk request."""
+    values = {name: item[name] for name in MENU_FIELDS + ["price"] if name in item}
+    values.update({name: Menu.validate_nutrition(name, item[name]) for name in NUTRITION if name in item})
+    return values
+
+
+def menu_rows_by_id(ids):
+    """Returns the rows (id, title_id, title, user_create) of the menu by id, selected in batches."""
+    rows = {}
+    for batch in batches(set(ids)):
+        for row in sess.query(Menu.id_menu_item, Menu.title_id, MenuItem.title, Menu.user_create).join(
+                MenuItem, Menu.title_id == MenuItem.id_item).filter(Menu.id_menu_item.in_(batch)):
+            rows[row.id_menu_item] = row
+    return rows
+
+
+def titles_in_use(titles):
+    """Returns the ids of the menu items by title, for the titles that are already in the database."""
+    found = {}
+    for batch in batches(set(titles)):
+        found.update(sess.query(MenuItem.title, MenuItem.id_item).filter(MenuItem.title.in_(batch)))
+    return found
+
+
+def access_error(curr_user, row):
+    if curr_user.role != ROLE_SUPER and curr_user.role != ROLE_ADMIN or \
+            curr_user.role == ROLE_ADMIN and curr_user.id != row.user_create:
+        return "No access to this item."
+    return None
+
+
+@app.route("/menu/bulk", methods=["POST"])
+@token_required
+def add_menu_items(curr_user):
+    """Adds the items of the JSON array (with the fields of POST /menu) in one transaction.
+    The whole batch is validated first, if any item is invalid, nothing is added and the errors are returned."""
+    if curr_user.role != ROLE_SUPER and curr_user.role != ROLE_ADMIN:
+        return jsonify({"message": "No access to this function."}), 403
+    items, error = bulk_request(with_id=False)
+    if error:
+        return error
+    categories = reference.categories
+    weights = reference.weights
+    existing = titles_in_use(item["title"] for item in items if isinstance(item.get("title"), str))
+    errors = []
+    titles = set()
+    for index, item in enumerate(items):
+        messages = bulk_errors(item, categories, weights)
+        title = item.get("title")
+        if not title:
+            messages.append("Title must be a non-empty.")
+        elif not isinstance(title, str):
+            messages.append("Title must be a string.")
+        elif title in existing or title in titles:
+            messages.append(f"{title} already exits. Title must be unique.")
+        else:
+            titles.add(title)
+        if messages:
+            errors.append({"index": index, "messages": messages})
+    if errors:
+        return jsonify(errors=errors), 400
+    try:
+        sess.bulk_insert_mappings(MenuItem, [dict({name: item.get(name) for name in ITEM_FIELDS},
+                                                  title=item["title"]) for item in items])
+        title_ids = titles_in_use(titles)
+        sess.bulk_insert_mappings(Menu, [dict(dict.fromkeys(MENU_FIELDS + NUTRITION),
+                                              **menu_values(item),
+                                              title_id=title_ids[item["title"]],
+                                              category_id=categories[item["category"]],
+                                              weight_id=weights[item["weight"]],
+                                              user_create=curr_user.id) for item in items])
+        ids = []
+        for batch in batches(title_ids.values()):
+            ids.extend(id_menu_item for id_menu_item, in sess.query(Menu.id_menu_item).filter(
+                Menu.title_id.in_(batch)))
+        sess.commit()
+    except exc.IntegrityError:
+        sess.rollback()
+        return jsonify({"message": "Some of the titles already exist. Title must be unique."}), 400
+    menu_changed()
+    return jsonify(menu={"Successfully added the new items in Menu:": sorted(ids)}), 201
+
+
+@app.route("/menu/bulk", methods=["PATCH"])
+@token_required
+def update_menu_items(curr_user):
+    """Updates the menu items of the JSON array in one transaction, each item has the id and the fields to change.
+    The whole batch is validated first, if any item is invalid, nothing is changed and the errors are returned."""
+    items, error = bulk_request()
+    if error:
+        return error
+    categories = reference.categories
+    weights = reference.weights
+    rows = menu_rows_by_id(item["id"] for item in items)
+    existing = titles_in_use(item["title"] for item in items if isinstance(item.get("title"), str))
+    errors = []
+    # The new title of each menu item (the rows of one item, its sizes, share the title) and the item of each title.
+    titles = {}
+    title_owners = {}
+    for index, item in enumerate(items):
+        row = rows.get(item["id"])
+        if row is None:
+            errors.append({"index": index, "messages": [f"Unable to find item with id: {item['id']}."]})
+            continue
+        messages = bulk_errors(item, categories, weights, partial=True)
+        if access_error(curr_user, row):
+            messages.append(access_error(curr_user, row))
+        if "title" in item:
+            title = item["title"]
+            if not title:
+                messages.append("Title must be a non-empty.")
+            elif not isinstance(title, str):
+                messages.append("Title must be a string.")
+            elif existing.get(title, row.title_id) != row.title_id or \
+                    title_owners.setdefault(title, row.title_id) != row.title_id or \
+                    titles.setdefault(row.title_id, title) != title:
+                messages.append(f"{title} already exists in the menu. Title must be unique.")
+        if messages:
+            errors.append({"index": index, "messages": messages})
+    if errors:
+        return jsonify(errors=errors), 400
+    menu_updates = []
+    item_updates = {}
+    for item in items:
+        update = menu_values(item)
+        if "category" in item:
+            update["category_id"] = categories[item["category"]]
+        if "weight" in item:
+            update["weight_id"] = weights[item["weight"]]
+        if update:
+            menu_updates.append(dict(update, id_menu_item=item["id"]))
+        update = {name: item[name] for name in ITEM_FIELDS + ["title"] if name in item}
+        if update:
+            item_updates.setdefault(rows[item["id"]].title_id, {}).update(update)
+    try:
+        sess.bulk_update_mappings(Menu, menu_updates)
+        sess.bulk_update_mappings(MenuItem, [dict(update, id_item=title_id) for title_id, update in item_updates.items()])
+        sess.commit()
+    except exc.IntegrityError:
+        sess.rollback()
+        return jsonify({"message": "Some of the titles already exist. Title must be unique."}), 400
+    menu_changed()
+    return jsonify(menu={"Successfully updated the items in Menu:": [item["id"] for item in items]}), 200
+
+
+@app.route("/menu/bulk", methods=["DELETE"])
+@token_required
+def delete_menu_items(curr_user):
+    """Deletes the menu items of the JSON array ([{"id": 1}, ...]) in one transaction.
+    If any item is not found or not accessible, nothing is deleted and the errors are returned."""
+    items, error = bulk_request()
+    if error:
+        return error
+    rows = menu_rows_by_id(item["id"] for item in items)
+    errors = []
+    for index, item in enumerate(items):
+        row = rows.get(item["id"])
+        message = f"Unable to find item with id: {item['id']}." if row is None else access_error(curr_user, row)
+        if message:
+            errors.append({"index": index, "messages": [message]})
+    if errors:
+        return jsonify(errors=errors), 400
+    try:
+        for batch in batches(rows):
+            sess.query(Menu).filter(Menu.id_menu_item.in_(batch)).delete(synchronize_session=False)
+        # The items left without rows in the Menu table are also removed from the table MenuItem.
+        for batch in batches({row.title_id for row in rows.values()}):
+            sess.query(MenuItem).filter(MenuItem.id_item.in_(batch)).filter(~MenuItem.menu_item.any()).delete(
+                synchronize_session=False)
+        sess.commit()
+    except exc.SQLAlchemyError:
+        sess.rollback()
+        raise
+    menu_changed()
+    return jsonify(menu={"Successfully deleted the items with ids:": sorted(rows)}), 200
+
+
 @app.route("/user", methods=["POST"])
+@rate_limited
 def create_user():
+    data = request.get_json()
+    new_user = User(name=data["name"], email=data["email"])
+    name_check = new_user.validate_name(data["name"])
+    email_check = new_user.validate_email(data["email"])
+    password_check = new_user.validate_password(data["password"])
+    for item in (name_check, email_check, password_check):
+        if isinstance(item, dict):
+            return jsonify(item), 400
+    # The connection is returned to the pool while the password is hashed.
+    sess.close()
+    password_pool.run(new_user.set_password, data["password"])
     try:
-        data = request.get_json()
-        new_user = User(name=data["name"], email=data["email"])
-        name_check = new_user.validate_name(data["name"])
-        email_check = new_user.validate_email(data["email"])
-        password_check = new_user.validate_password(data["password"])
-        for item in (name_check, email_check, password_check):
-            if isinstance(item, dict):
-                return jsonify(item), 400
-        new_user.set_password(data["password"])
         sess.add(new_user)
         sess.commit()
-        return jsonify({"message": "New user created!"}), 201
-    finally:
-        sess.close()
+    except exc.IntegrityError:
+        sess.rollback()
+        return jsonify({"message": f"{data['name']} already exists. Name and email must be unique."}), 400
+    return jsonify({"message": "New user created!"}), 201
 
 
 @app.route("/login", methods=["POST"])
+@rate_limited
 def login():
     auth = request.authorization
     if not auth or not auth.username or not auth.password:
@@ -236,13 +1004,57 @@ def login():
     if not user:
         return make_response("Could not verify: invalid name.", 401, {"WWW-Authenticate": "Basic realm='Login required!'"})
 
-    if user.check_password(auth.password):
-        token = jwt.encode({"email": user.email, "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=60)},
+    # The connection is returned to the pool while the password is checked, the user keeps the loaded values.
+    sess.close()
+    if password_pool.run(user.check_password, auth.password):
+        # The name and the role are not claims: token_required loads them with the user,
+        # so a changed user does not keep the role of the token until it expires.
+        token = jwt.encode({"id": user.id,
+                            "email": user.email,
+                            "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=60)},
                            app.config['SECRET_KEY'])
         return jsonify({"token": token})
 
     return make_response("Could not verify: invalid password.", 401, {"WWW-Authenticate": "Basic realm='Login required!'"})
 
 
+# The database is initialized and the menu is imported by the commands: flask menu init-db, flask menu import.
+# They are not run on import, so the start of the app does not depend on the database and the site.
+menu_cli = AppGroup("menu", help="Manages the database of the menu.")
+
+
+@menu_cli.command("init-db")
+def init_db_command():
+    """Creates the tables and fills in the categories and weights."""
+    from main import init_db
+    init_db()
+    click.echo("Initialized the database.")
+
+
+@menu_cli.command("migrate")
+def migrate_command():
+    """Creates the missing tables and indexes of an existing database."""
+    from main import migrate
+    migrate()
+    click.echo("Migrated the database.")
+
+
+@menu_cli.command("import")
+@click.option("--fixtures", help="Directory with <category>.json files to import instead of the site.")
+@click.option("--save", help="Directory to save the fetched feeds, to use them later as fixtures.")
+@click.option("--sync", is_flag=True, help="Update the imported menu to match the site.")
+@click.option("--report", help="File to save the JSON report of the changes made by --sync.")
+@click.option("--prune", is_flag=True, help="With --sync, delete the rows that are not in the feeds.")
+def import_command(fixtures, save, sync, report, prune):
+    """Imports the menu from the site into the database."""
+    from main import init_db
+    import importer
+    init_db()
+    importer.run(fixtures, save, sync, report, prune)
+
+
+app.cli.add_command(menu_cli)
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,203 @@
+from a2wsgi import WSGIMiddleware
+from app import app, catalog_version, menu_cache, search_cache, metrics, get_menu_items, menu_entry, entry_body, \
+    entry_encoding, parse_fields, parse_limit, search_params, search_view, price_extremes_view, full_menu_query, \
+    category_query, price_extremes_query, search_query, LISTING_PARAMS
+from models import DATABASE_URL, POOL_SIZE, POOL_MAX_OVERFLOW, POOL_TIMEOUT, reference, set_sqlite_pragmas
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.http import http_date, is_resource_modified, parse_accept_header
+from werkzeug.urls import url_decode
+import asyncio
+import datetime
+import json
+import os
+import time
+
+# The ASGI entry point of the app: uvicorn asgi:application
+# The reads of the menu (GET /menu, /menu/<category>, /menu/<category>/expensive and /cheap, /menu/search) are
+# served by async views on the asyncio engine, a waiting client takes no thread, so one process serves thousands
+# of polling clients. They share the caches and the catalog version with the Flask app, so the responses and
+# their ETags are the same. All the other routes (the listing, the export, the changes, login) are passed to
+# the Flask app, which runs in the threads of the WSGI middleware.
+
+# The same database through aiosqlite, another async URL can be set by MENU_ASYNC_DATABASE_URL.
+async_engine = create_async_engine(os.environ.get("MENU_ASYNC_DATABASE_URL") or
+                                   make_url(DATABASE_URL).set(drivername="sqlite+aiosqlite"),
+                                   poolclass=AsyncAdaptedQueuePool,
+                                   pool_size=POOL_SIZE,
+                                   max_overflow=POOL_MAX_OVERFLOW,
+                                   pool_timeout=POOL_TIMEOUT)
+event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+flask_application = WSGIMiddleware(app)
+
+# The entries being rendered by the cache key: the concurrent misses of a view (all the polling clients after
+# a change of the menu) wait for one query instead of running it each.
+pending = {}
+
+
+class Request:
+    """The GET request of an async view: the path, the query parameters and the headers."""
+
+    def __init__(self, scope):
+        self.path = scope["path"]
+        self.args = url_decode(scope["query_string"])
+        self.headers = {}
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1").lower()
+            value = value.decode("latin-1")
+            self.headers[name] = f"{self.headers[name]}, {value}" if name in self.headers else value
+        # The SQL of the request, for the metrics.
+        self.queries = 0
+        self.sql_seconds = 0
+
+    def environ(self):
+        """Returns the WSGI environ of the conditional headers, for is_resource_modified."""
+        environ = {"REQUEST_METHOD": "GET"}
+        for name in ("if-none-match", "if-modified-since"):
+            if name in self.headers:
+                environ["HTTP_" + name.upper().replace("-", "_")] = self.headers[name]
+        return environ
+
+
+def json_response(status, data):
+    """Returns the response with the JSON of the data, as jsonify of Flask."""
+    body = (json.dumps(data, separators=(",", ":")) + "\n").encode()
+    return status, [("Content-Type", "application/json"), ("Content-Length", str(len(body)))], body
+
+
+async def render_entry(request, key, load_query, fields, cache):
+    """Loads the rows of the query on the async engine and stores the rendered entry in the cache."""
+    statement = load_query().statement
+    start = time.perf_counter()
+    async with async_engine.connect() as connection:
+        rows = (await connection.execute(statement)).all()
+    request.queries += 1
+    request.sql_seconds += time.perf_counter() - start
+    # The rows are rendered in a thread, so a large menu does not stop the other requests.
+    entry = await asyncio.to_thread(lambda: menu_entry(key[0], get_menu_items(rows), fields))
+    cache.set(key, entry)
+    return entry
+
+
+async def menu_view(request, view, load_query, cache=menu_cache):
+    """Returns the response of the menu view as menu_response of the Flask app,
+    load_query returns the query of the rows on a miss of the cache."""
+    fields, error = parse_fields(request.args.get("fields"))
+    if error:
+        return json_response(400, {"message": error})
+    if fields:
+        view = f"{view}|fields={','.join(fields)}"
+    key = (view, catalog_version.value)
+    entry = cache.get(key)
+    if entry is None:
+        task = pending.get(key)
+        if task is None:
+            task = pending[key] = asyncio.ensure_future(render_entry(request, key, load_query, fields, cache))
+            task.add_done_callback(lambda done: pending.pop(key, None))
+        # A client that went away does not cancel the rendering for the others.
+        entry = await asyncio.shield(task)
+    encoding = entry_encoding(entry, parse_accept_header(request.headers.get("accept-encoding")))
+    if encoding and encoding not in entry[3]:
+        await asyncio.to_thread(entry_body, entry, encoding)
+    body, etag = entry_body(entry, encoding)
+    headers = [("Vary", "Accept-Encoding"), ("ETag", f'"{etag}"'), ("Cache-Control", "no-cache")]
+    modified = datetime.datetime.fromtimestamp(entry[2], datetime.timezone.utc)
+    if not is_resource_modified(request.environ(), etag=etag, last_modified=modified):
+        return 304, headers, b""
+    headers = [("Content-Type", "application/json"), ("Content-Length", str(len(body)))] + \
+              ([("Content-Encoding", encoding)] if encoding else []) + headers + \
+              [("Last-Modified", http_date(modified))]
+    return 200, headers, body
+
+
+async def get_all_menu(request):
+    return await menu_view(request, "menu", full_menu_query)
+
+
+async def get_items_category(request, category):
+    category_id = reference.categories.get(category)
+    if category_id is None:
+        return json_response(400, {"message": f"Invalid category name: {category}."})
+    return await menu_view(request, f"menu/{category}", lambda: category_query(category_id))
+
+
+async def price_extremes(request, category, highest):
+    limit, error = parse_limit(request.args.get("limit"))
+    if error:
+        return json_response(400, {"message": error})
+    category_id = reference.categories.get(category)
+    if category_id is None:
+        return json_response(400, {"message": f"Invalid category name: {category}."})
+    return await menu_view(request, price_extremes_view(category, highest, limit),
+                           lambda: price_extremes_query(category_id, highest, limit))
+
+
+async def search_menu(request):
+    params, error = search_params(request.args)
+    if error:
+        return json_response(400, {"message": error})
+    return await menu_view(request, search_view(*params), lambda: search_query(*params), cache=search_cache)
+
+
+def route(request):
+    """Returns the async view of the request, the rule of its route and the arguments of the view,
+    None if the request is served by the Flask app."""
+    if request.path == "/menu":
+        # The listing (the filters, sorts and pages of the menu) stays on the Flask app.
+        return None if LISTING_PARAMS.intersection(request.args) else (get_all_menu, "/menu", ())
+    if request.path == "/menu/search":
+        return search_menu, "/menu/search", ()
+    parts = request.path.split("/")
+    if len(parts) == 3 and parts[1] == "menu" and parts[2] and parts[2] != "export":
+        return get_items_category, "/menu/<category>", (parts[2],)
+    if len(parts) == 4 and parts[1] == "menu" and parts[2] and parts[3] in ("expensive", "cheap"):
+        return price_extremes, f"/menu/<category>/{parts[3]}", (parts[2], parts[3] == "expensive")
+    return None
+
+
+async def handle(request, view, rule, args, send):
+    """Runs the async view and sends its response, the request is recorded in the metrics of the app."""
+    start = time.perf_counter()
+    metrics.request_started()
+    try:
+        if reference.stale():
+            # The maps are loaded by the sync engine, in a thread so the other requests are not stopped.
+            await asyncio.to_thread(lambda: reference.categories)
+        status, headers, body = await view(request, *args)
+    except Exception:
+        metrics.observe(rule, "GET", 500, time.perf_counter() - start, request.queries, request.sql_seconds)
+        raise
+    finally:
+        metrics.request_finished()
+    metrics.observe(rule, "GET", status, time.perf_counter() - start, request.queries, request.sql_seconds)
+    await send({"type": "http.response.start",
+                "status": status,
+                "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def lifespan(receive, send):
+    """Loads the reference data at the start of the server and closes the connections at the end."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await asyncio.to_thread(lambda: reference.categories)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_engine.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["method"] == "GET":
+        request = Request(scope)
+        matched = route(request)
+        if matched is not None:
+            return await handle(request, *matched, send)
+    return await flask_application(scope, receive, send)
@@ -0,0 +1,214 @@
+"""Many concurrent polling clients: the sync WSGI server of app.py against the ASGI entry point (asgi.py).
+
+The catalog is generated once, then each mode runs as a server in its own process on it:
+- wsgi: app.run(threaded=True) of Flask, as app.py runs, a thread for each connection;
+- asgi: uvicorn asgi:application, the reads of the menu are async views on the asyncio engine.
+The clients are coroutines of this process, each one polls the urls in turn over its keep-alive connection
+(a new connection when the server closes it) for --seconds. With --conditional the clients send the ETag of
+the last response, as the polling clients do, and get 304 while the menu is the same.
+With --writes N another client adds an item to the menu N times per second, so the polls also miss the cache.
+The throughput, p50/p99 latency, the errors (failed connections and 5xx) and the peak RSS and threads of
+the server during the run are reported:
+    python benchmarks/asgi.py --rows 10000 --clients 1000 --seconds 20
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {"wsgi": [sys.executable, "-c", "import sys, app; app.app.run(port=int(sys.argv[1]), threaded=True)"],
+         "asgi": [sys.executable, "-m", "uvicorn", "asgi:application", "--log-level", "warning", "--backlog",
+                  "4096", "--port"]}
+URLS = ["/menu/pizza", "/menu/drink", "/menu/pizza/expensive", "/menu/search?q=cheese"]
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0
+
+
+class Connection:
+    """HTTP/1.1 connection of a client, it is opened again when the server closes it."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, url, headers=None, body=b""):
+        """Returns the status, the headers (lowercase names) and the body of the response."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        lines = [f"{method} {url} HTTP/1.1", f"Host: 127.0.0.1:{self.port}", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            head = await self.reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            # The server closed the kept connection, the request is sent again on a new one.
+            self.close()
+            return await self.request(method, url, headers, body)
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")[:-2]
+        version, status = status_line.split(" ")[:2]
+        response_headers = {}
+        for line in header_lines:
+            name, value = line.split(":", 1)
+            response_headers[name.strip().lower()] = value.strip()
+        if "content-length" in response_headers:
+            data = await self.reader.readexactly(int(response_headers["content-length"]))
+        elif int(status) in (204, 304):
+            data = b""
+        else:
+            data = await self.reader.read()
+        if version == "HTTP/1.0" or response_headers.get("connection", "").lower() == "close" or \
+                "content-length" not in response_headers and int(status) not in (204, 304):
+            self.close()
+        return int(status), response_headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def poll(port, urls, deadline, conditional, latencies, statuses):
+    """Polls the urls until the deadline, records the latency and the status of each response."""
+    connection = Connection(port)
+    etags = {}
+    number = 0
+    while time.perf_counter() < deadline:
+        url = urls[number % len(urls)]
+        number += 1
+        headers = {"If-None-Match": etags[url]} if conditional and url in etags else {}
+        start = time.perf_counter()
+        try:
+            status, response_headers, body = await connection.request("GET", url, headers)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            connection.close()
+            statuses["connection error"] += 1
+            await asyncio.sleep(0.1)
+            continue
+        latencies.append(time.perf_counter() - start)
+        statuses[str(status)] += 1
+        if "etag" in response_headers:
+            etags[url] = response_headers["etag"]
+    connection.close()
+
+
+async def write(port, writes, deadline, statuses, prefix):
+    """Adds a menu item writes times per second until the deadline, the titles start with the prefix."""
+    connection = Connection(port)
+    credentials = {"Authorization": "Basic " + base64.b64encode(b"super:password").decode()}
+    status, headers, body = await connection.request("POST", "/login", credentials)
+    token = json.loads(body)["token"]
+    number = 0
+    while time.perf_counter() < deadline:
+        number += 1
+        form = f"title={prefix}+item+{number}&category=pizza&weight=big&price=10&anonce=cheese&weight_desc=1+g" \
+               f"&calories=1".encode()
+        status, headers, body = await connection.request("POST", "/menu", {
+            "x-access-token": token, "Content-Type": "application/x-www-form-urlencoded"}, form)
+        statuses[f"write {status}"] += 1
+        await asyncio.sleep(1 / writes)
+    connection.close()
+
+
+async def sample_server(pid, deadline, peaks):
+    """Keeps the peak RSS and the peak number of threads of the server until the deadline."""
+    while time.perf_counter() < deadline:
+        try:
+            rss, threads = server_status(pid)
+        except OSError:
+            return
+        peaks["server_peak_rss_mb"] = max(peaks.get("server_peak_rss_mb", 0), rss)
+        peaks["server_peak_threads"] = max(peaks.get("server_peak_threads", 0), threads)
+        await asyncio.sleep(0.5)
+
+
+async def run_clients(port, pid, mode, args):
+    clients, seconds, conditional, writes = args.clients, args.seconds, args.conditional, args.writes
+    latencies = []
+    statuses = collections.Counter()
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    tasks = [poll(port, URLS[number % len(URLS):] + URLS[:number % len(URLS)], deadline, conditional, latencies,
+                  statuses) for number in range(clients)]
+    if writes:
+        tasks.append(write(port, writes, deadline, statuses, f"Benchmark+{mode}"))
+    peaks = {}
+    tasks.append(sample_server(pid, deadline, peaks))
+    await asyncio.gather(*tasks)
+    duration = time.perf_counter() - start
+    return {"requests": len(latencies),
+            "errors": sum(count for status, count in statuses.items() if not status[-3:].isdigit() or
+                          status[-3:] >= "500"),
+            "statuses": dict(sorted(statuses.items())),
+            "throughput_rps": len(latencies) / duration,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            **peaks}
+
+
+def server_status(pid):
+    """Returns the peak RSS (MB) and the number of threads of the process of the server."""
+    with open(f"/proc/{pid}/status") as file:
+        fields = dict(line.split(":", 1) for line in file)
+    return int(fields["VmHWM"].split()[0]) / 1024, int(fields["Threads"])
+
+
+def run_mode(mode, port, env, args):
+    """Starts the server of the mode, runs the clients against it and stops it, returns the results."""
+    server = subprocess.Popen(MODES[mode] + [str(port)], cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                asyncio.run(Connection(port).request("GET", "/menu/pizza"))
+                break
+            except OSError:
+                time.sleep(0.1)
+        return asyncio.run(run_clients(port, server.pid, mode, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the WSGI and the ASGI server with many polling clients.")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=1000, help="number of concurrent polling clients")
+    parser.add_argument("--seconds", type=float, default=20, help="duration of each mode")
+    parser.add_argument("--conditional", action="store_true", help="send If-None-Match with the last ETag")
+    parser.add_argument("--writes", type=float, default=0, help="changes of the menu per second")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--port", type=int, default=8642)
+    parser.add_argument("--output", help="file to save the JSON results")
+    args = parser.parse_args()
+    # Each client keeps a connection open, on both sides of it.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    database = os.path.join(tempfile.mkdtemp(), "menu.db")
+    env = dict(os.environ, MENU_DATABASE_URL=f"sqlite:///{database}")
+    os.environ["MENU_DATABASE_URL"] = env["MENU_DATABASE_URL"]
+    subprocess.run([sys.executable, "-c", "import sys; sys.path.insert(0, 'benchmarks'); "
+                    "from catalog import generate, create_user; "
+                    f"generate({args.rows}); create_user('super', 'password')"], cwd=ROOT, env=env, check=True)
+    results = {}
+    for mode in args.modes:
+        results[mode] = result = run_mode(mode, args.port, env, args)
+        print(f"{mode}: {result['throughput_rps']:8.1f} req/s, p50 {result['p50_ms']:8.2f} ms, "
+              f"p99 {result['p99_ms']:8.2f} ms, {result['requests']} requests, {result['errors']} errors, "
+              f"server {result.get('server_peak_rss_mb', 0):.0f} MB, {result.get('server_peak_threads', 0)} threads, "
+              f"statuses {result['statuses']}", flush=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"rows": args.rows, "clients": args.clients, "seconds": args.seconds,
+                       "conditional": args.conditional, "writes": args.writes, "results": results}, file, indent=2)
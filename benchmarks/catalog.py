@@ -0,0 +1,83 @@
+"""Synthetic catalogs for the benchmarks.
+
+The database is chosen by MENU_DATABASE_URL, it must be set before models is imported:
+    MENU_DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/catalog.py --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Category, Weight, MenuItem, Menu, User, sess, CATEGORIES_WITHOUT_NUTRITION, NUTRITION  # noqa: E402
+from main import init_db  # noqa: E402
+
+# The sizes of the items of each category, as they are imported from the site.
+SIZES = {"pizza": ["big", "medium", "thin"],
+         "snack": ["big", "medium"],
+         "dessert": ["standard"],
+         "drink": ["standard"],
+         "sauce": ["standard"]}
+WORDS = ["cheese", "spicy", "tomato", "mushroom", "chicken", "bacon", "pepper", "garlic", "onion", "olive",
+         "ham", "pineapple", "beef", "shrimp", "basil", "cream", "chocolate", "vanilla", "berry", "lemon"]
+BATCH_SIZE = 10000
+
+
+def generate(rows, seed=1):
+    """Adds about the given number of rows to the Menu table, spread over the five categories.
+    Returns the number of inserted rows."""
+    init_db()
+    rnd = random.Random(seed)
+    categories = dict(sess.query(Category.name, Category.id_category))
+    weights = dict(sess.query(Weight.weight, Weight.id_weight))
+    first_id = (sess.query(MenuItem.id_item).order_by(MenuItem.id_item.desc()).limit(1).scalar() or 0) + 1
+    items = []
+    menu = []
+    names = list(SIZES)
+    while len(menu) < rows:
+        id_item = first_id + len(items)
+        category = names[len(items) % len(names)]
+        words = rnd.sample(WORDS, 3)
+        items.append({"id_item": id_item,
+                      "title": f"{words[0].title()} {category} {id_item}",
+                      "anonce": f"{' '.join(words)} {' '.join(rnd.sample(WORDS, 5))}",
+                      "photo_small": f"https://example.com/{id_item}/small.jpg",
+                      "photo_first": f"https://example.com/{id_item}/1.jpg",
+                      "photo_second": f"https://example.com/{id_item}/2.jpg"})
+        for size in SIZES[category]:
+            row = {"title_id": id_item,
+                   "category_id": categories[category],
+                   "weight_id": weights[size],
+                   "weight_desc": f"{rnd.randint(100, 900)} g",
+                   "price": rnd.randint(10, 600) / 10}
+            for name in NUTRITION:
+                row[name] = None if category in CATEGORIES_WITHOUT_NUTRITION else rnd.randint(1, 400)
+            menu.append(row)
+    for start in range(0, len(items), BATCH_SIZE):
+        sess.execute(MenuItem.__table__.insert(), items[start:start + BATCH_SIZE])
+    for start in range(0, len(menu), BATCH_SIZE):
+        sess.execute(Menu.__table__.insert(), menu[start:start + BATCH_SIZE])
+    sess.commit()
+    return len(menu)
+
+
+def create_user(name, password, email=None):
+    """Adds the user, if there is no user with this name yet."""
+    init_db()
+    if not sess.query(User).filter(User.name == name).first():
+        user = User(name=name, email=email or f"{name}@example.com")
+        user.set_password(password)
+        sess.add(user)
+        sess.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fills the database with a synthetic catalog.")
+    parser.add_argument("--rows", type=int, default=1000, help="number of rows of the Menu table")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    count = generate(args.rows, args.seed)
+    print(f"Inserted {count} rows in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,59 @@
+"""Size and latency of GET /menu with the content codings and the sparse fieldsets.
+
+For each case the first request renders (and compresses) the menu, the next ones are served from the cache.
+The time of the JSON encoding of the menu by orjson and by the standard json is also reported.
+The app runs in-process on a temporary database with a synthetic catalog.
+    python benchmarks/compression.py --rows 10000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "menu.db")
+os.environ.setdefault("MENU_DATABASE_URL", f"sqlite:///{DATABASE}")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import generate  # noqa: E402
+import app as menu_app  # noqa: E402
+import encoding  # noqa: E402
+
+CASES = {"identity": ("/menu", "identity"),
+         "gzip": ("/menu", "gzip"),
+         "br": ("/menu", "br"),
+         "fields": ("/menu?fields=title,price,category", "identity"),
+         "fields+gzip": ("/menu?fields=title,price,category", "gzip")}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the size and latency of the compressed menu.")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20, help="number of the cached requests of each case")
+    args = parser.parse_args()
+    generate(args.rows)
+    client = menu_app.app.test_client()
+    for name, (url, accept) in CASES.items():
+        if accept not in encoding.ENCODINGS + ["identity"]:
+            print(f"{name:>12}: skipped, brotli is not installed")
+            continue
+        menu_app.menu_cache.clear()
+        start = time.perf_counter()
+        response = client.get(url, headers={"Accept-Encoding": accept})
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            client.get(url, headers={"Accept-Encoding": accept}).get_data()
+        cached = (time.perf_counter() - start) / args.repeat
+        print(f"{name:>12}: {len(response.get_data()) / 1024:9.1f} KB, first {first * 1000:8.1f} ms, "
+              f"cached {cached * 1000:6.2f} ms")
+    payload = {"menu": menu_app.get_menu_items(menu_app.menu_query())}
+    for name, dumps in (("orjson", encoding.dumps if encoding.orjson else None),
+                        ("json", lambda value: json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode())):
+        if dumps is None:
+            print(f"{name:>12}: skipped, orjson is not installed")
+            continue
+        start = time.perf_counter()
+        dumps(payload)
+        print(f"{name:>12}: encoded in {(time.perf_counter() - start) * 1000:.1f} ms")
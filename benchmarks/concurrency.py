@@ -0,0 +1,111 @@
+"""Stress test of the sessions: many threads read and change the menu at the same time.
+
+The readers request /menu and /menu/<category>, each writer adds, updates and deletes its own items
+and checks that the next read sees the change. Any error or stale read is reported, the exit code is 1.
+The app runs in-process on a temporary database with a synthetic catalog.
+"""
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import threading
+import time
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "menu.db")
+os.environ.setdefault("MENU_DATABASE_URL", f"sqlite:///{DATABASE}")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import generate, create_user, SIZES  # noqa: E402
+from app import app  # noqa: E402
+from models import Menu, MenuItem, sess  # noqa: E402
+
+
+def login(client, name, password):
+    credentials = base64.b64encode(f"{name}:{password}".encode()).decode()
+    return client.post("/login", headers={"Authorization": f"Basic {credentials}"}).get_json()["token"]
+
+
+def reader(errors, stop):
+    client = app.test_client()
+    categories = list(SIZES)
+    count = 0
+    while not stop.is_set():
+        url = "/menu" if count % 6 == 0 else f"/menu/{categories[count % len(categories)]}"
+        response = client.get(url)
+        if response.status_code != 200 or "menu" not in response.get_json():
+            errors.append(f"GET {url}: {response.status_code} {response.data[:200]}")
+        count += 1
+    return count
+
+
+def item_id_by_title(title):
+    try:
+        return sess.query(Menu.id_menu_item).join(MenuItem, Menu.title_id == MenuItem.id_item).filter(
+            MenuItem.title == title).scalar()
+    finally:
+        sess.remove()
+
+
+def titles(client, category):
+    return {item["title"]: item for item in client.get(f"/menu/{category}").get_json()["menu"]}
+
+
+def writer(number, token, iterations, errors):
+    client = app.test_client()
+    headers = {"x-access-token": token}
+    for iteration in range(iterations):
+        title = f"Stress {number}-{iteration}"
+        response = client.post("/menu", headers=headers, data={"title": title, "category": "pizza",
+                                                              "weight": "big", "price": "10"})
+        if response.status_code != 201:
+            errors.append(f"POST {title}: {response.status_code} {response.data[:200]}")
+            continue
+        if title not in titles(client, "pizza"):
+            errors.append(f"stale read: {title} is not in the menu after POST")
+        item_id = item_id_by_title(title)
+        response = client.put(f"/menu/{item_id}", headers=headers, data={"title": title, "category": "snack",
+                                                                        "weight": "big", "price": "20"})
+        if response.status_code != 201:
+            errors.append(f"PUT {title}: {response.status_code} {response.data[:200]}")
+        elif titles(client, "snack").get(title, {}).get("price") != 20:
+            errors.append(f"stale read: {title} is not updated after PUT")
+        response = client.delete(f"/menu/{item_id}", headers=headers)
+        if response.status_code != 200:
+            errors.append(f"DELETE {title}: {response.status_code} {response.data[:200]}")
+        elif title in titles(client, "snack"):
+            errors.append(f"stale read: {title} is in the menu after DELETE")
+
+
+def run(readers, writers, iterations, rows):
+    generate(rows)
+    create_user("super", "password")
+    token = login(app.test_client(), "super", "password")
+    errors = []
+    stop = threading.Event()
+    read_threads = [threading.Thread(target=reader, args=(errors, stop)) for _ in range(readers)]
+    write_threads = [threading.Thread(target=writer, args=(number, token, iterations, errors))
+                     for number in range(writers)]
+    start = time.perf_counter()
+    for thread in read_threads + write_threads:
+        thread.start()
+    for thread in write_threads:
+        thread.join()
+    stop.set()
+    for thread in read_threads:
+        thread.join()
+    print(f"{readers} readers, {writers} writers x {iterations} iterations, {rows} rows: "
+          f"{time.perf_counter() - start:.2f} s, {len(errors)} errors")
+    for error in errors[:20]:
+        print(f"  {error}")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reads and changes the menu from many threads.")
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+    sys.exit(1 if run(args.readers, args.writers, args.iterations, args.rows) else 0)
@@ -0,0 +1,70 @@
+"""Peak memory and time to first byte of the export of the whole menu.
+
+The catalog is generated once, then each case runs in its own process on it, so the peak RSS of the process
+is the cost of the response: GET /menu (the whole menu rendered in memory) and the streamed
+GET /menu/export?format=ndjson and format=csv. The app runs in-process, the body is read and dropped.
+    python benchmarks/export.py --rows 1000000
+The RSS also counts the page cache and the mmap of SQLite (up to cache_size and mmap_size of the profile),
+to see only the memory of the app, run with MENU_DB_PRAGMAS="mmap_size=0,cache_size=-2000".
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+CASES = {"menu": "/menu", "ndjson": "/menu/export?format=ndjson", "csv": "/menu/export?format=csv"}
+
+
+def peak_rss():
+    """Returns the peak RSS of the process in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(url):
+    """Reads the response of the url in this process, returns the measurements."""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app
+
+    client = app.app.test_client()
+    rss_before = peak_rss()
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    first_byte = None
+    size = 0
+    for chunk in response.response:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    response.close()
+    return {"status": response.status_code,
+            "ttfb_ms": (first_byte or total) * 1000,
+            "total_s": total,
+            "mb": size / 1024 / 1024,
+            "rss_before_mb": rss_before,
+            "peak_rss_mb": peak_rss()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the memory and TTFB of the export of the menu.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--case", choices=list(CASES), help="run only this case in this process")
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(run_case(CASES[args.case])))
+        sys.exit()
+    database = os.path.join(tempfile.mkdtemp(), "menu.db")
+    env = dict(os.environ, MENU_DATABASE_URL=f"sqlite:///{database}")
+    subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.py"),
+                    "--rows", str(args.rows)], env=env, check=True)
+    for name in CASES:
+        output = subprocess.run([sys.executable, __file__, "--case", name], env=env, capture_output=True, text=True,
+                                check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{name:>6}: status {result['status']}, TTFB {result['ttfb_ms']:.1f} ms, "
+              f"total {result['total_s']:.2f} s, {result['mb']:.1f} MB, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB (after start {result['rss_before_mb']:.0f} MB)")
@@ -0,0 +1,86 @@
+"""Latency of the menu reads during a storm of logins.
+
+The menu is read by several threads, first alone and then while many threads log in concurrently
+(each from its own address, so the rate limit does not stop them). With --unbounded the pool of the
+password hashing gets a worker for each login thread, as if the passwords were hashed on the request threads. The p50/p99 of the menu reads are
+reported for both phases, with the counts of the login responses (200, 429, 503).
+The app runs in-process on a temporary database with a synthetic catalog.
+"""
+import argparse
+import base64
+import collections
+import os
+import sys
+import tempfile
+import threading
+import time
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "menu.db")
+os.environ.setdefault("MENU_DATABASE_URL", f"sqlite:///{DATABASE}")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import generate, create_user, SIZES  # noqa: E402
+from limits import BoundedPool  # noqa: E402
+import app as menu_app  # noqa: E402
+
+app = menu_app.app
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0
+
+
+def read_menu(latencies, stop):
+    client = app.test_client()
+    categories = list(SIZES)
+    count = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        client.get(f"/menu/{categories[count % len(categories)]}")
+        latencies.append(time.perf_counter() - start)
+        count += 1
+
+
+def log_in(number, statuses, stop):
+    client = app.test_client()
+    credentials = base64.b64encode(b"storm:password").decode()
+    while not stop.is_set():
+        response = client.post("/login", headers={"Authorization": f"Basic {credentials}"},
+                               environ_base={"REMOTE_ADDR": f"10.{number // 250}.{number % 250}.1"})
+        statuses[response.status_code] += 1
+
+
+def phase(readers, logins, duration):
+    latencies = []
+    statuses = collections.Counter()
+    stop = threading.Event()
+    threads = [threading.Thread(target=read_menu, args=(latencies, stop)) for _ in range(readers)]
+    threads += [threading.Thread(target=log_in, args=(number, statuses, stop)) for number in range(logins)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the menu latency during a storm of logins.")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--logins", type=int, default=64, help="number of threads logging in")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--unbounded", action="store_true", help="hash all the passwords at once")
+    args = parser.parse_args()
+    generate(args.rows)
+    create_user("storm", "password")
+    menu_app.login_limiter.rate = 10 ** 6
+    if args.unbounded:
+        menu_app.password_pool = BoundedPool(workers=args.logins, queue_size=0)
+    for name, logins in (("menu only", 0), ("login storm", args.logins)):
+        latencies, statuses = phase(args.readers, logins, args.duration)
+        print(f"{name:>11}: menu p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+              f"p99 {percentile(latencies, 99) * 1000:.2f} ms, {len(latencies) / args.duration:.0f} reads/s, "
+              f"logins {dict(statuses)}")
@@ -0,0 +1,50 @@
+"""Latency of the full-text search of the menu on a synthetic catalog.
+
+GET /menu/search is called with single words, prefixes, several words and category filters,
+the p50/p99 of each query are reported: cold (the cache of the search is cleared before each call)
+and cached. The app runs in-process on a temporary database.
+    python benchmarks/search.py --rows 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+DATABASE = os.path.join(tempfile.mkdtemp(), "menu.db")
+os.environ.setdefault("MENU_DATABASE_URL", f"sqlite:///{DATABASE}")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import generate  # noqa: E402
+import app as menu_app  # noqa: E402
+
+QUERIES = ["cheese", "chee", "ch", "spicy mushroom", "garlic basil lemon", "pizza 4242",
+           "cheese&category=pizza", "berry&category=dessert&category=drink", "cheese&limit=10", "nothing"]
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the latency of the full-text search of the menu.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=50, help="number of calls of each query")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    generate(args.rows)
+    print(f"Catalog of {args.rows} rows in {time.perf_counter() - start:.2f} s")
+    client = menu_app.app.test_client()
+    for query in QUERIES:
+        cold = []
+        cached = []
+        for _ in range(args.repeat):
+            menu_app.search_cache.clear()
+            for latencies in (cold, cached):
+                start = time.perf_counter()
+                response = client.get(f"/menu/search?q={query}")
+                latencies.append(time.perf_counter() - start)
+        print(f"{query:>40}: {len(response.get_json()['menu']):>4} rows, "
+              f"cold p50 {percentile(cold, 50) * 1000:.2f} ms, p99 {percentile(cold, 99) * 1000:.2f} ms, "
+              f"cached p50 {percentile(cached, 50) * 1000:.2f} ms, p99 {percentile(cached, 99) * 1000:.2f} ms")
@@ -0,0 +1,121 @@
+"""Read latency of the menu queries with concurrent writers, for the SQLite profiles.
+
+Each case runs in its own process on a new database with a synthetic catalog:
+- before: the default SQLite settings (MENU_DB_PROFILE=default) without the indexes of the Menu table;
+- after: the WAL profile with the indexes.
+The readers run the queries of /menu/pizza/expensive and of the rows of one item (as after POST/PUT),
+without the response cache; the writers update the prices of random rows, each update in its own transaction.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+CASES = {"before": {"MENU_DB_PROFILE": "default", "indexes": False},
+         "after": {"MENU_DB_PROFILE": "wal", "indexes": True}}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0
+
+
+def run_case(rows, readers, writers, duration, indexes):
+    """Runs the readers and writers in this process, returns the measurements."""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from catalog import generate
+    from sqlalchemy import exc, func
+    from models import Menu, engine, sess
+    import app
+
+    generate(rows)
+    if not indexes:
+        for index in Menu.__table__.indexes:
+            index.drop(engine, checkfirst=True)
+    ids = [row[0] for row in sess.query(Menu.id_menu_item)]
+    title_ids = [row[0] for row in sess.query(Menu.title_id).distinct()]
+    random.Random(0).shuffle(title_ids)
+    sess.remove()
+    latencies = []
+    writes = []
+    errors = []
+    stop = threading.Event()
+
+    def reader(number):
+        count = number
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                if count % 2:
+                    app.get_menu_items(app.menu_query().filter(Menu.title_id == title_ids[count % len(title_ids)]))
+                else:
+                    price = sess.query(func.max(Menu.price)).filter(Menu.category_id == 1).scalar()
+                    app.get_menu_items(app.menu_query().filter(Menu.category_id == 1).filter(Menu.price == price))
+                latencies.append(time.perf_counter() - start)
+            except exc.OperationalError as error:
+                errors.append(str(error))
+            finally:
+                sess.remove()
+            count += 1
+
+    def writer(number):
+        rnd = random.Random(number)
+        while not stop.is_set():
+            try:
+                sess.query(Menu).filter(Menu.id_menu_item == rnd.choice(ids)).update(
+                    {Menu.price: rnd.randint(10, 600) / 10}, synchronize_session=False)
+                sess.commit()
+                writes.append(1)
+            except exc.OperationalError as error:
+                sess.rollback()
+                errors.append(str(error))
+            finally:
+                sess.remove()
+
+    threads = [threading.Thread(target=reader, args=(number,)) for number in range(readers)]
+    threads += [threading.Thread(target=writer, args=(number,)) for number in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {"reads": len(latencies),
+            "reads_per_second": len(latencies) / duration,
+            "writes_per_second": len(writes) / duration,
+            "read_p50_ms": percentile(latencies, 50) * 1000,
+            "read_p99_ms": percentile(latencies, 99) * 1000,
+            "read_mean_ms": statistics.mean(latencies) * 1000 if latencies else 0,
+            "errors": len(errors)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the read latency with concurrent writers.")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--case", choices=list(CASES), help="run only this case in this process")
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(run_case(args.rows, args.readers, args.writers, args.duration,
+                                  CASES[args.case]["indexes"])))
+        sys.exit()
+    for name, case in CASES.items():
+        directory = tempfile.mkdtemp()
+        env = dict(os.environ, MENU_DB_PROFILE=case["MENU_DB_PROFILE"],
+                   MENU_DATABASE_URL=f"sqlite:///{os.path.join(directory, 'menu.db')}")
+        output = subprocess.run([sys.executable, __file__, "--case", name, "--rows", str(args.rows),
+                                 "--readers", str(args.readers), "--writers", str(args.writers),
+                                 "--duration", str(args.duration)], env=env, capture_output=True, text=True,
+                                check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{name:>6}: read p50 {result['read_p50_ms']:.2f} ms, p99 {result['read_p99_ms']:.2f} ms, "
+              f"{result['reads_per_second']:.0f} reads/s, {result['writes_per_second']:.0f} writes/s, "
+              f"{result['errors']} errors")
@@ -0,0 +1,36 @@
+"""Measures the time of the cold import of the app.
+
+Each import is run in a new interpreter, the result is the median of the runs.
+To compare with another version, point --path at its checkout, for example:
+    git worktree add /tmp/menu_old <commit>
+    python benchmarks/startup.py --path /tmp/menu_old
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def measure(path, module="app", runs=10):
+    """Returns the durations of the cold imports of the module in the directory, in seconds."""
+    durations = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", CODE.format(module=module)], cwd=path,
+                                capture_output=True, text=True, check=True).stdout
+        durations.append(float(output.strip().splitlines()[-1]))
+    return durations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the time of the cold import of the app.")
+    parser.add_argument("--path", default=ROOT, help="directory of the project (default: this checkout)")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    result = measure(args.path, args.module, args.runs)
+    print(f"import {args.module}: median {statistics.median(result) * 1000:.1f} ms, "
+          f"min {min(result) * 1000:.1f} ms, max {max(result) * 1000:.1f} ms ({args.runs} runs)")
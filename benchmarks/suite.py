@@ -0,0 +1,243 @@
+"""Benchmark suite of the REST API: throughput and p50/p99 latency of the main endpoints.
+
+The app runs in-process on a temporary database with a synthetic catalog of --rows rows (see catalog.py).
+Each scenario sends up to --requests requests (or for at most --max-seconds) from --threads threads:
+- menu_cached: GET /menu from the cache of the rendered menu;
+- menu, menu_category, menu_expensive: GET /menu, /menu/<category>, /menu/pizza/expensive, rendered each time;
+- menu_page: a page of the listing, GET /menu?category=pizza&sort=price&limit=100;
+- login: POST /login (with more threads than the pool of password hashing, some of them get 503);
+- create, update, delete: POST /menu, PUT and DELETE /menu/<id> of the created items.
+The results are printed and saved as JSON with --output. With --baseline the results are compared with
+an earlier run, and the exit code is 1 if the p50 latency or the throughput of any scenario is worse than
+the baseline by more than --tolerance (0.25 = 25%), or it got more errors than the baseline (without the statuses
+the scenario expects, see EXPECTED_STATUSES), so the suite can fail a CI job:
+    python benchmarks/suite.py --rows 10000 --output base.json
+    python benchmarks/suite.py --rows 10000 --output new.json --baseline base.json
+With --current FILE, the saved results are compared with the baseline without running the suite.
+"""
+import argparse
+import base64
+import collections
+import datetime
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCENARIOS = ["menu_cached", "menu", "menu_category", "menu_expensive", "menu_page", "login", "create", "update",
+             "delete"]
+CATEGORIES = ["pizza", "snack", "dessert", "drink", "sauce"]
+# The error statuses a scenario is designed to get, their number depends on the scheduling of the threads:
+# the logins beyond the pool of password hashing get 503, beyond the rate limit 429.
+EXPECTED_STATUSES = {"login": {"429", "503"}}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0
+
+
+def measure(request, requests, threads, max_seconds):
+    """Calls request(number) from the threads until the requests are sent or the time is over.
+    Returns the measurements of the scenario."""
+    numbers = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    statuses = collections.Counter()
+    deadline = time.perf_counter() + max_seconds
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with lock:
+                number = next(numbers)
+            if number >= requests:
+                return
+            start = time.perf_counter()
+            status = request(number)
+            latency = time.perf_counter() - start
+            with lock:
+                latencies.append(latency)
+                statuses[status] += 1
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    duration = time.perf_counter() - start
+    return {"requests": len(latencies),
+            "errors": sum(count for status, count in statuses.items() if status >= 400),
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+            "throughput_rps": len(latencies) / duration if duration else 0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0}
+
+
+def run_suite(rows, requests, threads, max_seconds, scenarios):
+    """Generates the catalog and runs the scenarios, returns the results."""
+    database = os.path.join(tempfile.mkdtemp(), "menu.db")
+    os.environ["MENU_DATABASE_URL"] = f"sqlite:///{database}"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from catalog import generate, create_user
+    from models import Menu, MenuItem, sess
+    import app as menu_app
+
+    start = time.perf_counter()
+    generate(rows)
+    create_user("super", "password")
+    generated = time.perf_counter() - start
+    app = menu_app.app
+    menu_app.login_limiter.rate = 10 ** 9
+    clients = threading.local()
+
+    def client():
+        if not hasattr(clients, "client"):
+            clients.client = app.test_client()
+        return clients.client
+
+    credentials = {"Authorization": "Basic " + base64.b64encode(b"super:password").decode()}
+    token = {"x-access-token": client().post("/login", headers=credentials).get_json()["token"]}
+    created = []
+    lock = threading.Lock()
+
+    def get(url, cached=True):
+        if not cached:
+            menu_app.menu_cache.clear()
+        return client().get(url).status_code
+
+    def item_form(title, price="10"):
+        return {"title": title, "category": "pizza", "weight": "big", "price": price,
+                "anonce": "cheese tomato", "weight_desc": "800 g", "calories": "250"}
+
+    def load_created():
+        """Loads the ids and titles of the items added by the scenario create."""
+        created.extend(sess.query(Menu.id_menu_item, MenuItem.title).join(
+            MenuItem, Menu.title_id == MenuItem.id_item).filter(MenuItem.title.like("Benchmark item %")).order_by(
+            Menu.id_menu_item))
+        sess.remove()
+
+    def update(number):
+        id_menu_item, title = created[number % len(created)]
+        return client().put(f"/menu/{id_menu_item}", data=item_form(title, price="12"), headers=token).status_code
+
+    def delete(number):
+        with lock:
+            if not created:
+                return 404
+            id_menu_item, title = created.pop()
+        return client().delete(f"/menu/{id_menu_item}", headers=token).status_code
+
+    requests_of = {
+        "menu_cached": lambda number: get("/menu"),
+        "menu": lambda number: get("/menu", cached=False),
+        "menu_category": lambda number: get(f"/menu/{CATEGORIES[number % len(CATEGORIES)]}", cached=False),
+        "menu_expensive": lambda number: get("/menu/pizza/expensive", cached=False),
+        "menu_page": lambda number: get("/menu?category=pizza&sort=price&limit=100", cached=False),
+        "login": lambda number: client().post("/login", headers=credentials).status_code,
+        "create": lambda number: client().post("/menu", data=item_form(f"Benchmark item {number}"),
+                                               headers=token).status_code,
+        "update": update,
+        "delete": delete}
+    results = {}
+    for name in scenarios:
+        if name in ("update", "delete") and not created:
+            load_created()
+            if not created:
+                continue
+        scenario_requests = min(requests, len(created)) if name == "delete" else requests
+        results[name] = measure(requests_of[name], scenario_requests, threads, max_seconds)
+        print(f"{name:>15}: {results[name]['throughput_rps']:8.1f} req/s, p50 {results[name]['p50_ms']:8.2f} ms, "
+              f"p99 {results[name]['p99_ms']:8.2f} ms, {results[name]['requests']} requests, "
+              f"{results[name]['errors']} errors", flush=True)
+    return {"meta": {"rows": rows,
+                     "requests": requests,
+                     "threads": threads,
+                     "generate_s": generated,
+                     "commit": git_commit(),
+                     "python": platform.python_version(),
+                     "sqlite": sqlite3.sqlite_version,
+                     "platform": platform.platform(),
+                     "date": datetime.datetime.now().isoformat(timespec="seconds")},
+            "scenarios": results}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def unexpected_errors(name, result):
+    """Returns the number of the error responses of the scenario, without the statuses it expects."""
+    if "statuses" not in result:
+        return result["errors"]
+    return sum(count for status, count in result["statuses"].items()
+               if int(status) >= 400 and status not in EXPECTED_STATUSES.get(name, ()))
+
+
+def compare(current, baseline, tolerance):
+    """Prints the changes of the scenarios against the baseline, returns the names of the regressed ones.
+    A scenario regressed if its p50 grew or its throughput fell by more than the tolerance,
+    or it got more errors than the baseline (the expected statuses, such as 503 of login, are not counted).
+    A scenario that completed no request (no throughput) regressed too."""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if not base:
+            continue
+        p50 = result["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0
+        if result["throughput_rps"]:
+            throughput = base["throughput_rps"] / result["throughput_rps"] - 1
+        else:
+            throughput = float("inf") if base["throughput_rps"] else 0
+        regressed = p50 > tolerance or throughput > tolerance or not result["requests"] or \
+            unexpected_errors(name, result) > unexpected_errors(name, base)
+        if regressed:
+            regressions.append(name)
+        print(f"{name:>15}: p50 {base['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms ({p50:+.0%}), "
+              f"throughput {base['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s"
+              f"{'  REGRESSION' if regressed else ''}")
+    for name in ("rows", "threads"):
+        if current["meta"].get(name) != baseline["meta"].get(name):
+            print(f"Warning: the runs differ in {name}: {baseline['meta'].get(name)} and {current['meta'].get(name)}.")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the throughput and latency of the endpoints.")
+    parser.add_argument("--rows", type=int, default=10000, help="number of rows of the synthetic catalog")
+    parser.add_argument("--requests", type=int, default=200, help="requests of each scenario")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--max-seconds", type=float, default=20, help="time limit of each scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--output", help="file to save the JSON results")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--current", help="JSON results to compare with the baseline, instead of running")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    args = parser.parse_args()
+    if args.current:
+        with open(args.current, encoding="utf-8") as file:
+            current = json.load(file)
+    else:
+        current = run_suite(args.rows, args.requests, args.threads, args.max_seconds, args.scenarios)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as file:
+                json.dump(current, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
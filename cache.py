@@ -0,0 +1,78 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class CatalogVersion:
+    """Monotonically increasing version of the menu catalog.
+    It is bumped by the handlers that change the menu, after the commit."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 1
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+            return self.value
+
+
+class LRUCache:
+    """Bounded in-process cache with LRU eviction.
+    The entries also expire after ttl seconds, in case a change of the data was not reported to the cache
+    (for example, it was made by another process)."""
+
+    def __init__(self, max_size=128, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._items[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Stores the value, ttl overrides the time to live of the cache for this entry."""
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def discard_if(self, predicate):
+        """Removes the entries for which predicate(key, value) is true."""
+        with self._lock:
+            for key in [key for key, (value, expires) in self._items.items() if predicate(key, value)]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        """Returns the counters of the cache."""
+        with self._lock:
+            return {"size": len(self._items),
+                    "max_size": self.max_size,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "expirations": self.expirations}
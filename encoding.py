@@ -0,0 +1,34 @@
+import gzip
+import json
+
+# orjson and brotli are optional: without orjson the standard json is used, without brotli only gzip is offered.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# The content codings of the responses in the order of preference.
+ENCODINGS = (["br"] if brotli is not None else []) + ["gzip"]
+# The responses are compressed once for each catalog version, so a better (slower) level is affordable.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 6
+
+
+def dumps(value):
+    """Returns the compact JSON of the value as UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def compress(body, encoding):
+    """Returns the body compressed by the content coding, one of ENCODINGS."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # Without the time in the header the same body is always compressed to the same bytes.
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
@@ -0,0 +1,283 @@
+from models import MenuItem, Menu, sess, reference, CATEGORIES_WITHOUT_NUTRITION, NUTRITION
+from main import parse_csr, init_db, nutrition_value, PIZZAS_URL, SNACKS_URL, DESSERTS_URL, DRINKS_URL, SAUCES_URL
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import argparse
+import json
+import os
+import time
+
+
+# The feeds of the site for each category of the menu.
+FEEDS = {"pizza": PIZZAS_URL,
+         "snack": SNACKS_URL,
+         "dessert": DESSERTS_URL,
+         "drink": DRINKS_URL,
+         "sauce": SAUCES_URL}
+# The fields compared by the sync, the rows are matched by title, category and size.
+ITEM_FIELDS = ["anonce", "photo_small", "photo_first", "photo_second"]
+MENU_FIELDS = ["weight_desc", "price"] + NUTRITION
+# The number of ids in one DELETE statement (SQLite limits the number of parameters).
+BATCH_SIZE = 500
+
+
+class Timings(dict):
+    """Durations of the stages of the import, in seconds."""
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self[name] = self.get(name, 0) + time.perf_counter() - start
+
+    def report(self):
+        return "\n".join(f"{name}: {seconds:.3f} s" for name, seconds in self.items())
+
+
+def load_feed(category, fixtures=None):
+    """Returns the items of the category from the site,
+    or from the file <category>.json of the fixtures directory, if it is given."""
+    if fixtures:
+        with open(os.path.join(fixtures, f"{category}.json"), encoding="utf-8") as file:
+            return json.load(file)["response"]["data"]
+    return parse_csr(FEEDS[category])
+
+
+def fetch_feeds(fixtures=None):
+    """Returns the items of all categories, the feeds are fetched concurrently and only once."""
+    with ThreadPoolExecutor(max_workers=len(FEEDS)) as executor:
+        futures = {category: executor.submit(load_feed, category, fixtures) for category in FEEDS}
+        return {category: future.result() for category, future in futures.items()}
+
+
+def save_feeds(feeds, directory):
+    """Saves the fetched feeds in the format of the site, so they can be used as fixtures."""
+    os.makedirs(directory, exist_ok=True)
+    for category, items in feeds.items():
+        with open(os.path.join(directory, f"{category}.json"), "w", encoding="utf-8") as file:
+            json.dump({"response": {"data": items}}, file, ensure_ascii=False)
+
+
+def menu_item_row(category, item):
+    """Returns the values of MenuItem for the item of the feed."""
+    anonce = ""
+    photo_first = ""
+    photo_second = ""
+    if category == "pizza" or category == "snack":
+        anonce = item["anonce"]
+        photo_first = item["photo1"]
+        photo_second = item["photo2"]
+    return {"title": item["title"],
+            "anonce": f"{anonce}",
+            "photo_small": item["photo_small"],
+            "photo_first": f"{photo_first}",
+            "photo_second": f"{photo_second}"}
+
+
+def menu_rows(category, item):
+    """Returns the values of Menu for each size of the item of the feed.
+    The title, category and weight are names, they are replaced with ids before the insert."""
+    if category != "pizza" and category != "snack":
+        # Keywords in the categories: (dessert, drinks, sauces) are similar, you can combine them into one group.
+        row = {"title": item["title"],
+               "category": category,
+               "weight": "standard",
+               "weight_desc": item["description" if category == "sauce" else "anonce"],
+               "price": item["price"] / 10000}
+        for name in NUTRITION:
+            row[name] = None if category in CATEGORIES_WITHOUT_NUTRITION else nutrition_value(item[name])
+        return [row]
+    if category == "pizza":
+        # Checking in the requested data the presence of thin-crust pizzas
+        weight_items = ["big_weight", "medium_weight"] if item["is_thin"] == 0 else \
+            ["big_weight", "medium_weight", "thin_weight"]
+        nutrition = "{}_thin_{}"
+    else:
+        # Checking the requested data for medium snacks
+        weight_items = ["big_amount"] if item["has_medium"] == 0 else ["big_amount", "medium_amount"]
+        nutrition = "{}_{}"
+    rows = []
+    for weight in weight_items:
+        weight_item = weight.split("_")[0]
+        row = {"title": item["title"],
+               "category": category,
+               "weight": weight_item,
+               "weight_desc": item[weight],
+               "price": item[f"{weight_item}_price"] / 10000}
+        for name in NUTRITION:
+            row[name] = nutrition_value(item[nutrition.format(weight_item, name)])
+        rows.append(row)
+    return rows
+
+
+def feed_rows(feeds):
+    """Returns the values of MenuItem by title and the values of Menu by (title, category, size) for the feeds."""
+    items = {}
+    rows = {}
+    for category, feed in feeds.items():
+        for item in feed:
+            if item["title"] not in items:
+                items[item["title"]] = menu_item_row(category, item)
+            for row in menu_rows(category, item):
+                rows[(row["title"], row["category"], row["weight"])] = row
+    return items, rows
+
+
+def menu_row_ids(rows, titles, categories, weights):
+    """Replaces the names of title, category and weight in the rows with ids."""
+    for row in rows:
+        row["title_id"] = titles[row.pop("title")]
+        row["category_id"] = categories[row.pop("category")]
+        row["weight_id"] = weights[row.pop("weight")]
+    return rows
+
+
+def differs(current, row, fields):
+    """Checks if the fields of the row read from the database differ from the values of the feed."""
+    for name in fields:
+        old = getattr(current, name)
+        new = row[name]
+        if name == "price":
+            if old is None or float(old) != float(new):
+                return True
+        elif str("" if old is None else old) != str("" if new is None else new):
+            return True
+    return False
+
+
+def batches(values, size=BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def import_catalog(feeds, timings):
+    """Inserts the items of the feeds into the tables MenuItem and Menu in one transaction.
+    The ids of titles, categories and weights are taken from the maps loaded once, not queried for each row."""
+    try:
+        with timings.stage("prepare"):
+            categories = reference.categories
+            weights = reference.weights
+            titles = dict(sess.query(MenuItem.title, MenuItem.id_item))
+            items, rows = feed_rows(feeds)
+            new_items = [item for title, item in items.items() if title not in titles]
+        with timings.stage("insert"):
+            sess.bulk_insert_mappings(MenuItem, new_items)
+            titles = dict(sess.query(MenuItem.title, MenuItem.id_item))
+            sess.bulk_insert_mappings(Menu, menu_row_ids(rows.values(), titles, categories, weights))
+        with timings.stage("commit"):
+            sess.commit()
+    except:
+        sess.rollback()
+        raise
+    return len(new_items), len(rows)
+
+
+def sync_catalog(feeds, timings, prune=False):
+    """Brings the tables MenuItem and Menu in line with the feeds in one transaction.
+    The rows are matched by title, category and size, only the needed inserts, updates and deletes are issued,
+    in batches. The rows of the categories of the feeds that are not in the feeds (the items added by the admins
+    are among them) are only reported as missing, with prune they are deleted. A category with an empty feed
+    is never pruned, the site returned nothing rather than removed the whole category.
+    Returns the report of the changes."""
+    try:
+        with timings.stage("prepare"):
+            categories = reference.categories
+            weights = reference.weights
+            category_names = reference.category_names
+            weight_names = reference.weight_names
+            current_items = {row.title: row for row in sess.query(MenuItem.id_item, MenuItem.title,
+                                                                   *[getattr(MenuItem, name) for name in ITEM_FIELDS])}
+            current_rows = {(row.title, category_names[row.category_id], weight_names[row.weight_id]): row
+                            for row in sess.query(Menu.id_menu_item,
+                                                  MenuItem.title,
+                                                  Menu.category_id,
+                                                  Menu.weight_id,
+                                                  *[getattr(Menu, name) for name in MENU_FIELDS]).join(
+                                MenuItem, Menu.title_id == MenuItem.id_item)}
+            items, rows = feed_rows(feeds)
+
+            new_items = [item for title, item in items.items() if title not in current_items]
+            changed_items = [dict(item, id_item=current_items[title].id_item) for title, item in items.items()
+                             if title in current_items and differs(current_items[title], item, ITEM_FIELDS)]
+            inserted = [key for key in rows if key not in current_rows]
+            updated = [key for key, row in rows.items()
+                       if key in current_rows and differs(current_rows[key], row, MENU_FIELDS)]
+            missing = [key for key in current_rows if key[1] in feeds and key not in rows]
+            empty = sorted(category for category, feed in feeds.items() if not feed)
+            deleted = [key for key in missing if key[1] not in empty] if prune else []
+            missing = [key for key in missing if key not in deleted]
+        with timings.stage("write"):
+            sess.bulk_insert_mappings(MenuItem, new_items)
+            sess.bulk_update_mappings(MenuItem, changed_items)
+            titles = dict(sess.query(MenuItem.title, MenuItem.id_item))
+            sess.bulk_insert_mappings(Menu, menu_row_ids([rows[key] for key in inserted], titles, categories, weights))
+            sess.bulk_update_mappings(Menu, [dict({name: rows[key][name] for name in MENU_FIELDS},
+                                                  id_menu_item=current_rows[key].id_menu_item) for key in updated])
+            for batch in batches(current_rows[key].id_menu_item for key in deleted):
+                sess.query(Menu).filter(Menu.id_menu_item.in_(batch)).delete(synchronize_session=False)
+            # The items left without rows in the Menu table are also removed from the table MenuItem.
+            for batch in batches({key[0] for key in deleted}):
+                sess.query(MenuItem).filter(MenuItem.title.in_(batch)).filter(~MenuItem.menu_item.any()).delete(
+                    synchronize_session=False)
+        with timings.stage("commit"):
+            sess.commit()
+    except:
+        sess.rollback()
+        raise
+    return {"items": {"inserted": [item["title"] for item in new_items],
+                      "updated": [item["title"] for item in changed_items]},
+            "menu": {"inserted": inserted,
+                     "updated": updated,
+                     "deleted": deleted,
+                     "missing": missing},
+            "empty_feeds": empty}
+
+
+def run(fixtures=None, save=None, sync=False, report=None, prune=False):
+    """Imports the menu from the site (or from the fixtures), if it is not in the database yet.
+    With sync, the menu in the database is updated to match the site and the report of the changes is printed
+    (and saved to the report file, if it is given). With prune, the sync also deletes the rows not in the feeds.
+    Returns the timings of the stages."""
+    timings = Timings()
+    if not sync and sess.query(Menu).first():
+        print("The menu is already imported, use --sync to update it.")
+        return timings
+    with timings.stage("fetch"):
+        feeds = fetch_feeds(fixtures)
+    if save:
+        save_feeds(feeds, save)
+    if sync:
+        changes = sync_catalog(feeds, timings, prune)
+        print(f"Items: {len(changes['items']['inserted'])} inserted, {len(changes['items']['updated'])} updated.")
+        print(f"Menu: {len(changes['menu']['inserted'])} inserted, {len(changes['menu']['updated'])} updated, "
+              f"{len(changes['menu']['deleted'])} deleted, {len(changes['menu']['missing'])} not in the feeds.")
+        if changes["empty_feeds"]:
+            print(f"Empty feeds, not pruned: {', '.join(changes['empty_feeds'])}.")
+        for change, keys in changes["menu"].items():
+            for key in keys[:10]:
+                print(f"  {change}: {' / '.join(key)}")
+            if len(keys) > 10:
+                print(f"  ... and {len(keys) - 10} more {change}")
+        if report:
+            with open(report, "w", encoding="utf-8") as file:
+                json.dump(changes, file, ensure_ascii=False, indent=2)
+    else:
+        items, rows = import_catalog(feeds, timings)
+        print(f"Imported {items} items and {rows} rows of the menu.")
+    print(timings.report())
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Imports the menu from the site into the database.")
+    parser.add_argument("--fixtures", help="directory with <category>.json files to import instead of the site")
+    parser.add_argument("--save", help="directory to save the fetched feeds, to use them later as fixtures")
+    parser.add_argument("--sync", action="store_true", help="update the imported menu to match the site")
+    parser.add_argument("--report", help="file to save the JSON report of the changes made by --sync")
+    parser.add_argument("--prune", action="store_true", help="with --sync, delete the rows that are not in the feeds")
+    args = parser.parse_args()
+    init_db()
+    run(args.fixtures, args.save, args.sync, args.report, args.prune)
@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+
+class Busy(Exception):
+    """The pool has no free place for the task."""
+
+
+class BoundedPool:
+    """Pool of threads for slow tasks (hashing of passwords) with a limited queue.
+    When all workers are busy and the queue is full, the task is rejected at once instead of waiting."""
+
+    def __init__(self, workers, queue_size, timeout=None):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        self._places = threading.BoundedSemaphore(workers + queue_size)
+        self.rejected = 0
+
+    def run(self, function, *args):
+        """Runs the function in the pool and returns its result, raises Busy if the pool is full."""
+        if not self._places.acquire(blocking=False):
+            self.rejected += 1
+            raise Busy()
+        try:
+            future = self._executor.submit(function, *args)
+        except:
+            self._places.release()
+            raise
+        future.add_done_callback(lambda _: self._places.release())
+        return future.result(timeout=self.timeout)
+
+
+class RateLimiter:
+    """Token bucket for each client: rate requests per period, with bursts up to rate.
+    The buckets of at most max_clients clients are kept, the least recently seen are dropped."""
+
+    def __init__(self, rate, period, max_clients=10000):
+        self.rate = rate
+        self.period = period
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def allow(self, client):
+        """Takes a token of the client, returns 0 if it is allowed, else the seconds until the next token."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - updated) * self.rate / self.period)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) * self.period / self.rate
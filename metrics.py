@@ -0,0 +1,140 @@
+from bisect import bisect_left
+import threading
+
+# The upper bounds of the buckets of the histograms: the seconds of the requests (and of their SQL)
+# and the number of SQL statements of a request.
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 1000)
+# The most statements kept for the log of a slow request.
+MAX_STATEMENTS = 100
+
+
+class Histogram:
+    """Cumulative histogram of the observed values, as in Prometheus: the count of the values
+    less than or equal to each bound, the sum and the count of all values."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """Returns the pairs (le, cumulative count) of the buckets, the last is +Inf."""
+        total = 0
+        samples = []
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            total += count
+            samples.append((bound, total))
+        return samples
+
+
+def labels_text(labels):
+    """Returns the labels in the format of Prometheus: {name="value",...}."""
+    values = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        values.append(f'{name}="{value}"')
+    return "{" + ",".join(values) + "}"
+
+
+class Metrics:
+    """Metrics of the requests of the app: the latency, the number and the time of the SQL statements
+    of each endpoint and the requests in flight. They are rendered in the text format of Prometheus."""
+
+    HISTOGRAMS = {"menu_http_request_duration_seconds": ("Latency of the requests.", SECONDS_BUCKETS),
+                  "menu_sql_queries_per_request": ("SQL statements of a request.", QUERIES_BUCKETS),
+                  "menu_sql_duration_seconds": ("Time of the SQL statements of a request.", SECONDS_BUCKETS)}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: {} for name in self.HISTOGRAMS}
+        self.in_flight = 0
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def observe(self, endpoint, method, status, seconds, queries, sql_seconds):
+        """Records the finished request, the latency by endpoint, method and status, the SQL by endpoint."""
+        with self._lock:
+            for name, labels, value in (
+                    ("menu_http_request_duration_seconds", (("endpoint", endpoint), ("method", method),
+                                                            ("status", status)), seconds),
+                    ("menu_sql_queries_per_request", (("endpoint", endpoint),), queries),
+                    ("menu_sql_duration_seconds", (("endpoint", endpoint),), sql_seconds)):
+                histograms = self._histograms[name]
+                if labels not in histograms:
+                    histograms[labels] = Histogram(self.HISTOGRAMS[name][1])
+                histograms[labels].observe(value)
+
+    def render(self, caches=None):
+        """Returns the metrics in the text format of Prometheus, with the counters of the caches
+        (name -> stats() of LRUCache)."""
+        lines = ["# HELP menu_http_requests_in_flight Requests being served.",
+                 "# TYPE menu_http_requests_in_flight gauge",
+                 f"menu_http_requests_in_flight {self.in_flight}"]
+        with self._lock:
+            for name, (description, buckets) in self.HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    for bound, count in histogram.samples():
+                        lines.append(f"{name}_bucket{labels_text(labels + (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{labels_text(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{labels_text(labels)} {histogram.count}")
+        caches = caches or {}
+        for field, kind, description in (("hits", "counter", "Hits of the cache."),
+                                         ("misses", "counter", "Misses of the cache."),
+                                         ("evictions", "counter", "Entries evicted from the full cache."),
+                                         ("size", "gauge", "Entries in the cache."),
+                                         ("hit_ratio", "gauge", "Hits of the cache to all lookups.")):
+            name = f"menu_cache_{field}_total" if kind == "counter" else f"menu_cache_{field}"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for cache, stats in caches.items():
+                if field == "hit_ratio":
+                    lookups = stats["hits"] + stats["misses"]
+                    value = stats["hits"] / lookups if lookups else 0
+                else:
+                    value = stats[field]
+                lines.append(f"{name}{labels_text((('cache', cache),))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class QueryTracker(threading.local):
+    """The SQL statements of the current request of each thread, recorded by the events of the engine.
+    The statements outside of a request (or streamed after it) are not counted."""
+
+    def __init__(self):
+        self.active = False
+        self.count = 0
+        self.seconds = 0
+        self.statements = None
+
+    def start(self, keep_statements=False):
+        """Starts counting the statements, with keep_statements their text is kept for the log."""
+        self.active = True
+        self.count = 0
+        self.seconds = 0
+        self.statements = [] if keep_statements else None
+
+    def record(self, statement, seconds):
+        if not self.active:
+            return
+        self.count += 1
+        self.seconds += seconds
+        if self.statements is not None and len(self.statements) < MAX_STATEMENTS:
+            self.statements.append((statement, seconds))
+
+    def stop(self):
+        self.active = False
@@ -0,0 +1,290 @@
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, String, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship, object_session, validates
+from sqlalchemy.pool import QueuePool
+from sqlalchemy import create_engine, select
+from flask_login import UserMixin
+from werkzeug.security import generate_password_hash, check_password_hash
+import math
+import os
+import threading
+import time
+
+
+CATEGORIES_MENU = ["pizza", "snack", "dessert", "drink", "sauce"]
+WEIGHT_ITEMS = ["big", "medium", "thin", "standard"]
+# In the menu of these categories there are no values (calories, carbs, fats, proteins), they are NULL.
+CATEGORIES_WITHOUT_NUTRITION = ["drink", "sauce"]
+NUTRITION = ["calories", "carbohydrates", "fats", "proteins"]
+# The roles of the users, see README: super and admin are given by the name of the user.
+ROLE_SUPER = "super"
+ROLE_ADMIN = "admin"
+ROLE_USER = "user"
+DATABASE_URL = os.environ.get("MENU_DATABASE_URL", "sqlite:///menu.db")
+# The connections are kept in the pool and shared by the threads, each thread uses one at a time.
+POOL_SIZE = int(os.environ.get("MENU_DB_POOL_SIZE", 10))
+POOL_MAX_OVERFLOW = int(os.environ.get("MENU_DB_POOL_MAX_OVERFLOW", 20))
+POOL_TIMEOUT = int(os.environ.get("MENU_DB_POOL_TIMEOUT", 30))
+# The pragmas set on each new connection to SQLite, the profile is chosen by MENU_DB_PROFILE.
+# With WAL the writes of the admin endpoints do not block the readers of the menu.
+# The single pragmas can be overridden by MENU_DB_PRAGMAS, for example: "cache_size=-20000,mmap_size=0".
+SQLITE_PROFILES = {"default": {},
+                   "wal": {"journal_mode": "WAL",
+                           "synchronous": "NORMAL",
+                           "busy_timeout": 5000,
+                           "cache_size": -65536,
+                           "mmap_size": 268435456,
+                           "temp_store": "MEMORY"}}
+SQLITE_PROFILE = os.environ.get("MENU_DB_PROFILE", "wal")
+
+Base = declarative_base()
+engine = create_engine(DATABASE_URL,
+                       connect_args={"check_same_thread": False},
+                       poolclass=QueuePool,
+                       pool_size=POOL_SIZE,
+                       max_overflow=POOL_MAX_OVERFLOW,
+                       pool_timeout=POOL_TIMEOUT)
+session = sessionmaker(bind=engine)
+
+
+def sqlite_pragmas():
+    """Returns the pragmas of the chosen profile with the overrides from MENU_DB_PRAGMAS."""
+    pragmas = dict(SQLITE_PROFILES[SQLITE_PROFILE])
+    for item in os.environ.get("MENU_DB_PRAGMAS", "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            pragmas[name.strip()] = value.strip()
+    return pragmas
+
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(connection, record):
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def parse_number(value):
+    """Returns the nutrition value as a number, None for an empty value. The decimal comma is accepted.
+    Raises ValueError if the value is not a number."""
+    if value is None or isinstance(value, str) and not value.strip():
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Not a number: {value}")
+    number = float(value.strip().replace(",", ".") if isinstance(value, str) else value)
+    if not math.isfinite(number):
+        raise ValueError(f"Not a number: {value}")
+    return number
+
+
+# Each thread gets its own session, the app removes it at the end of the request (see app.remove_session).
+sess = scoped_session(session)
+
+
+class Category(Base):
+    __tablename__ = "categories"
+    id_category = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True, nullable=False)
+    menu_item = relationship("Menu", back_populates="category")
+
+    @staticmethod
+    def validate_category(name):
+        if not name:
+            return {"message": "Category must be a non-empty."}
+        if name not in reference.categories:
+            return {"message": f"Invalid category name: {name}."}
+        return name
+
+
+class Weight(Base):
+    __tablename__ = "weight_items"
+    id_weight = Column(Integer, primary_key=True)
+    weight = Column(String(50), unique=True, nullable=False)
+    menu_item = relationship("Menu", back_populates="weight")
+
+    @staticmethod
+    def validate_weight(weight):
+        if not weight:
+            return {"message": "Weight must be a non-empty."}
+        if weight not in reference.weights:
+            return {"message": f"Invalid weight name: {weight}."}
+        return weight
+
+
+class MenuItem(Base):
+    __tablename__ = "menu_items"
+    id_item = Column(Integer, primary_key=True)
+    title = Column(String(150), unique=True, nullable=False)
+    menu_item = relationship("Menu", back_populates="title")
+    anonce = Column(String(250))
+    photo_small = Column(String(250))
+    photo_first = Column(String(250))
+    photo_second = Column(String(250))
+
+    @staticmethod
+    def validate_title(title):
+        if not title:
+            return {"message": "Title must be a non-empty."}
+        if sess.query(MenuItem).filter(MenuItem.title == title).first():
+            return {"message": f"{title} already exits. Title must be unique."}
+        return title
+
+
+class Menu(Base):
+    __tablename__ = "menu"
+    id_menu_item = Column(Integer, primary_key=True)
+    title_id = Column(Integer, ForeignKey("menu_items.id_item"), index=True)
+    title = relationship("MenuItem", back_populates="menu_item")
+    category_id = Column(Integer, ForeignKey("categories.id_category"), index=True)
+    category = relationship("Category", back_populates="menu_item")
+    weight_id = Column(Integer, ForeignKey("weight_items.id_weight"), index=True)
+    weight = relationship("Weight", back_populates="menu_item")
+    weight_desc = Column(String(250))
+    price = Column(Integer, nullable=False, index=True)
+    # The nutrition values are numbers, so they can be filtered and sorted in SQL.
+    calories = Column(Float, index=True)
+    carbohydrates = Column(Float, index=True)
+    fats = Column(Float, index=True)
+    proteins = Column(Float, index=True)
+    user_create = Column(Integer, ForeignKey("users.id"), default=1)
+    user = relationship("User", back_populates="menu_item")
+    # The index serves the filters by category and min/max of the price in a category.
+    __table_args__ = (Index("ix_menu_category_id_price", "category_id", "price"),)
+
+    @staticmethod
+    def validate_price(value):
+        if not value:
+            return {"message": "Price must be a non-empty."}
+        if isinstance(value, bool):
+            return {"message": "Price must be integer."}
+        try:
+            float(value)
+        except (ValueError, TypeError):
+            return {"message": "Price must be integer."}
+        return value
+
+    @staticmethod
+    def validate_nutrition(name, value):
+        try:
+            return parse_number(value)
+        except (ValueError, TypeError):
+            return {"message": f"{name.title()} must be a number."}
+
+
+class User(UserMixin, Base):
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), unique=True, nullable=False)
+    email = Column(String(100), unique=True, nullable=False)
+    password_hash = Column(String(100), nullable=False)
+    menu_item = relationship("Menu", back_populates="user")
+
+    @property
+    def role(self):
+        if self.name == ROLE_SUPER or self.name == ROLE_ADMIN:
+            return self.name
+        return ROLE_USER
+
+    def validate_name(self, name):
+        if not name:
+            return {"message": "Name must be a non-empty."}
+        if sess.query(User).filter(User.name == name).first():
+            return {"message": f"{name} already exits. Email must be unique."}
+        return name
+
+    def validate_email(self, email):
+        if not email:
+            return {"message": "Email must be a non-empty."}
+        if "@" not in email or "." not in email:
+            return {"message": "Email must contain characters: '@' and '.'"}
+        if sess.query(User).filter(User.email == email).first():
+            return {"message": f"{email} already exits. Email must be unique."}
+        return email
+
+    def validate_password(self, password):
+        if len(password) < 6:
+            return {"message": "Password must be longer than 6 characters."}
+
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+
+
+class ReferenceData:
+    """The maps name -> id and id -> name of the categories and weights, a small and almost static vocabulary.
+    They are loaded on first use, and reloaded after a commit that changed Category or Weight rows
+    (or after max_age seconds, if they were changed by another process)."""
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._loaded = None
+        self._maps = None
+
+    def invalidate(self):
+        self._loaded = None
+
+    def stale(self):
+        """Returns True if the maps have to be loaded (again)."""
+        return self._loaded is None or time.monotonic() - self._loaded > self.max_age
+
+    def _load(self):
+        with engine.connect() as connection:
+            categories = dict(connection.execute(select(Category.name, Category.id_category)).all())
+            weights = dict(connection.execute(select(Weight.weight, Weight.id_weight)).all())
+        return {"categories": categories,
+                "category_names": {id_category: name for name, id_category in categories.items()},
+                "weights": weights,
+                "weight_names": {id_weight: weight for weight, id_weight in weights.items()}}
+
+    def _get(self, name):
+        if self.stale():
+            with self._lock:
+                if self.stale():
+                    self._maps = self._load()
+                    self._loaded = time.monotonic()
+        return self._maps[name]
+
+    @property
+    def categories(self):
+        """Ids of the categories by name."""
+        return self._get("categories")
+
+    @property
+    def category_names(self):
+        """Names of the categories by id."""
+        return self._get("category_names")
+
+    @property
+    def weights(self):
+        """Ids of the weights by name."""
+        return self._get("weights")
+
+    @property
+    def weight_names(self):
+        """Names of the weights by id."""
+        return self._get("weight_names")
+
+
+reference = ReferenceData()
+
+
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+@event.listens_for(Weight, "after_insert")
+@event.listens_for(Weight, "after_update")
+@event.listens_for(Weight, "after_delete")
+def reference_changed(mapper, connection, target):
+    object_session(target).info["reference_changed"] = True
+
+
+@event.listens_for(session, "after_commit")
+def reload_reference(db_session):
+    if db_session.info.pop("reference_changed", False):
+        reference.invalidate()
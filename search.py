@@ -0,0 +1,65 @@
+from sqlalchemy import column, literal_column, table, text
+import re
+
+
+# The full-text index of the menu (SQLite FTS5), one row for each row of the Menu table with the same rowid.
+# The title and anonce are copied from MenuItem, the weight_desc from Menu; the triggers keep them in sync,
+# so the index follows every write: the endpoints, the bulk endpoints and the importer.
+menu_search = table("menu_search", column("rowid"), column("rank"))
+SEARCH_MATCH = literal_column("menu_search").op("MATCH")
+# The weights of the columns in the ranking (bm25): title, anonce, weight_desc.
+SEARCH_RANK = "bm25(10.0, 4.0, 1.0)"
+# The prefixes of 2 and 3 characters are indexed, so the short prefix queries do not scan the whole vocabulary.
+SEARCH_TABLE = """CREATE VIRTUAL TABLE menu_search USING fts5(
+    title, anonce, weight_desc, tokenize="unicode61 remove_diacritics 2", prefix="2 3")"""
+SEARCH_TRIGGERS = {"menu_search_insert": """AFTER INSERT ON menu BEGIN
+    INSERT INTO menu_search (rowid, title, anonce, weight_desc)
+    SELECT new.id_menu_item, title, anonce, new.weight_desc FROM menu_items WHERE id_item = new.title_id;
+END""",
+                   "menu_search_update": """AFTER UPDATE ON menu BEGIN
+    DELETE FROM menu_search WHERE rowid = old.id_menu_item;
+    INSERT INTO menu_search (rowid, title, anonce, weight_desc)
+    SELECT new.id_menu_item, title, anonce, new.weight_desc FROM menu_items WHERE id_item = new.title_id;
+END""",
+                   "menu_search_delete": """AFTER DELETE ON menu BEGIN
+    DELETE FROM menu_search WHERE rowid = old.id_menu_item;
+END""",
+                   "menu_search_item_update": """AFTER UPDATE OF title, anonce ON menu_items BEGIN
+    UPDATE menu_search SET title = new.title, anonce = new.anonce
+    WHERE rowid IN (SELECT id_menu_item FROM menu WHERE title_id = new.id_item);
+END"""}
+SEARCH_FILL = """INSERT INTO menu_search (rowid, title, anonce, weight_desc)
+SELECT id_menu_item, title, anonce, weight_desc FROM menu JOIN menu_items ON id_item = title_id"""
+
+
+def create_search_index(engine):
+    """Creates the index with its triggers, if they do not exist, and fills it with the rows of the menu.
+    The index is available only with SQLite."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as connection:
+        if not connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'menu_search'")).first():
+            connection.execute(text(SEARCH_TABLE))
+            connection.execute(text(f"INSERT INTO menu_search (menu_search, rank) VALUES ('rank', '{SEARCH_RANK}')"))
+            connection.execute(text(SEARCH_FILL))
+        for name, trigger in SEARCH_TRIGGERS.items():
+            connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {trigger}"))
+
+
+def drop_search_triggers(connection):
+    """Drops the triggers of the index before the tables of the menu are rebuilt,
+    create_search_index creates them again."""
+    if connection.dialect.name != "sqlite":
+        return
+    for name in SEARCH_TRIGGERS:
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+
+def match_query(query):
+    """Returns the FTS5 query for the words of the search: all words must be found, each as a prefix.
+    The words are quoted, so the syntax of FTS5 in the search is taken literally. Returns None if there are
+    no words."""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
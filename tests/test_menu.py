@@ -0,0 +1,217 @@
+import base64
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+# The app reads the database from MENU_DATABASE_URL when it is imported, the tests use a temporary one.
+os.environ["MENU_DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'menu.db')}"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from catalog import create_user, generate  # noqa: E402
+import concurrency  # noqa: E402
+from models import Menu, engine, reference, sess  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+import app as menu_app  # noqa: E402
+import importer  # noqa: E402
+
+MENU_URLS = ["/menu", "/menu/pizza", "/menu/pizza/expensive", "/menu/pizza/cheap"]
+
+
+@contextlib.contextmanager
+def count_queries():
+    """Collects the SQL statements run on the engine inside the block."""
+    statements = []
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def menu_queries(client, url):
+    """Returns the number of the queries of the uncached response of the url and the number of its items."""
+    menu_app.menu_cache.clear()
+    with count_queries() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(statements), len(response.get_json()["menu"])
+
+
+@pytest.fixture(scope="module")
+def query_counts():
+    """The queries and the items of each url with about 10 and about 200 rows in the menu."""
+    client = menu_app.app.test_client()
+    counts = {}
+    for rows in (10, 190):
+        generate(rows)
+        # The categories and weights are loaded once for all requests, not counted for a response.
+        reference.invalidate()
+        reference.categories
+        counts[rows] = {url: menu_queries(client, url) for url in MENU_URLS}
+    return counts[10], counts[190]
+
+
+@pytest.mark.parametrize("url", MENU_URLS)
+def test_menu_is_one_query(query_counts, url):
+    small, large = query_counts
+    assert large["/menu"][1] >= 200 > small["/menu"][1]
+    assert small[url][0] == large[url][0] == 1
+
+
+@pytest.fixture(scope="module")
+def admin():
+    """The test client and the token of a super user, the menu has some rows."""
+    client = menu_app.app.test_client()
+    if not sess.query(Menu.id_menu_item).first():
+        generate(10)
+    sess.remove()
+    create_user("super", "password")
+    credentials = {"Authorization": "Basic " + base64.b64encode(b"super:password").decode()}
+    return client, {"x-access-token": client.post("/login", headers=credentials).get_json()["token"]}
+
+
+BULK_ITEM = {"title": "Bulk item", "category": "pizza", "weight": "big", "price": 10, "anonce": "cheese",
+             "weight_desc": "800 g", "calories": 250}
+
+
+def test_token_role_follows_the_user(admin):
+    client = admin[0]
+    create_user("admin", "password")
+    credentials = {"Authorization": "Basic " + base64.b64encode(b"admin:password").decode()}
+    token = {"x-access-token": client.post("/login", headers=credentials).get_json()["token"]}
+    assert client.post("/menu", headers=token).status_code == 400
+    user = sess.query(menu_app.User).filter(menu_app.User.name == "admin").one()
+    user.name = "clerk"
+    sess.commit()
+    sess.remove()
+    assert client.post("/menu", headers=token).status_code == 403
+
+
+@pytest.mark.parametrize("field, value", [("title", ["x"]), ("category", ["pizza"]), ("weight", {"big": 1}),
+                                          ("price", [1]), ("price", True), ("anonce", {"a": 1}),
+                                          ("weight_desc", {"a": 1}), ("photo_small", 1), ("id", True)])
+def test_bulk_rejects_values_of_wrong_type(admin, field, value):
+    client, token = admin
+    if field == "id":
+        # A JSON boolean is an int in Python, it must not select the row with the id 1.
+        for method in (client.patch, client.delete):
+            response = method("/menu/bulk", json=[{"id": value}], headers=token)
+            assert response.status_code == 400
+            assert response.get_json() == {"message": "Each item must have the integer id of the menu item."}
+        return
+    response = client.post("/menu/bulk", json=[dict(BULK_ITEM, **{field: value})], headers=token)
+    assert response.status_code == 400
+    assert response.get_json()["errors"][0]["index"] == 0
+    if field != "title":
+        id_menu_item = sess.query(Menu.id_menu_item).limit(1).scalar()
+        sess.remove()
+        response = client.patch("/menu/bulk", json=[{"id": id_menu_item, field: value}], headers=token)
+        assert response.status_code == 400
+        assert response.get_json()["errors"][0]["index"] == 0
+
+
+@pytest.mark.parametrize("data", [["category", "asc", {"a": 1}, 1], ["category", "asc", [1], 1],
+                                  ["category", "asc", True, 1], ["category", "asc", 1, "1"], ["price", "asc", 1, 1],
+                                  {"a": 1}, ["category", "asc", 1, 1, 1]])
+def test_listing_rejects_tampered_cursor(data):
+    cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+    response = menu_app.app.test_client().get(f"/menu?limit=5&cursor={cursor}")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "Invalid cursor."}
+
+
+@pytest.mark.parametrize("url, args", [("/menu/pizza/cheap", {}), ("/menu", {}), ("/menu/search", {"q": "cheese"})])
+@pytest.mark.parametrize("limit", ["\u00b2", "0", "-1", "1.5"])
+def test_invalid_limit_is_rejected(url, args, limit):
+    response = menu_app.app.test_client().get(url, query_string={**args, "limit": limit})
+    assert response.status_code == 400
+    assert response.get_json()["message"].startswith("Limit must be an integer")
+
+
+@pytest.mark.parametrize("param, value, message", [("category", "soup", "Invalid category name: soup."),
+                                                   ("size", "huge", "Invalid weight name: huge.")])
+def test_listing_rejects_unknown_names(param, value, message):
+    response = menu_app.app.test_client().get("/menu", query_string={param: value})
+    assert response.status_code == 400
+    assert response.get_json() == {"message": message}
+
+
+def test_failed_menu_is_not_cached(monkeypatch):
+    client = menu_app.app.test_client()
+    menu_app.menu_cache.clear()
+
+    class FailedRows:
+        def __iter__(self):
+            raise menu_app.exc.OperationalError("SELECT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(menu_app, "category_query", lambda category_id: FailedRows())
+    assert client.get("/menu/pizza").status_code == 500
+    monkeypatch.undo()
+    response = client.get("/menu/pizza")
+    assert response.status_code == 200
+    assert response.get_json()["menu"]
+
+
+def test_failed_statements_are_not_timed_with_the_next_one():
+    with menu_app.app.test_request_context(), engine.connect() as connection:
+        menu_app.query_tracker.start()
+        try:
+            for _ in range(3):
+                with pytest.raises(menu_app.exc.OperationalError):
+                    connection.exec_driver_sql("SELECT * FROM missing_table")
+            time.sleep(0.2)
+            connection.exec_driver_sql("SELECT 1")
+        finally:
+            menu_app.query_tracker.stop()
+    assert menu_app.query_tracker.count == 1
+    assert 0 < menu_app.query_tracker.seconds < 0.1
+
+
+def test_threads_read_their_own_writes(admin):
+    """The stress test of benchmarks/concurrency.py at a small size."""
+    token = admin[1]["x-access-token"]
+    errors = []
+    stop = threading.Event()
+    readers = [threading.Thread(target=concurrency.reader, args=(errors, stop)) for _ in range(4)]
+    writers = [threading.Thread(target=concurrency.writer, args=(number, token, 3, errors)) for number in range(2)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert errors == []
+
+
+def test_sync_prunes_only_when_asked(admin):
+    def sauces():
+        titles = [row.title for row in sess.query(menu_app.MenuItem.title).join(
+            Menu, Menu.title_id == menu_app.MenuItem.id_item).filter(Menu.category_id == reference.categories["sauce"])]
+        sess.remove()
+        return set(titles)
+
+    before = sauces()
+    assert before
+    feed = [{"title": "Synced sauce", "description": "30 g", "photo_small": "s", "price": 50000}]
+    changes = importer.sync_catalog({"sauce": feed}, importer.Timings())
+    assert changes["menu"]["deleted"] == []
+    assert {key[0] for key in changes["menu"]["missing"]} == before
+    assert sauces() == before | {"Synced sauce"}
+    changes = importer.sync_catalog({"sauce": []}, importer.Timings(), prune=True)
+    assert changes["menu"]["deleted"] == [] and changes["empty_feeds"] == ["sauce"]
+    changes = importer.sync_catalog({"sauce": feed}, importer.Timings(), prune=True)
+    assert {key[0] for key in changes["menu"]["deleted"]} == before
+    assert sauces() == {"Synced sauce"}